@@ -107,6 +107,10 @@ def browse():
             parent_dir = '/'.join(parts[:-1]) + '/'
             if parent_dir.startswith(directory) and parent_dir != directory:
                 directories.add(parent_dir)
+    # The template lists files as given, so pass only the ones directly in this directory
+    parent = directory if directory.endswith('/') else directory + '/'
+    files = {path: info for path, info in files.items()
+             if path.rsplit('/', 1)[0] + '/' == parent}
     return render_template('browse.html', files=files, directories=sorted(directories), current_dir=directory)
 
 @app.route('/register', methods=['GET', 'POST'])
@@ -1,31 +1,47 @@
 from flask import Flask, request, jsonify, render_template, redirect, url_for, flash, send_file
+from flask.json.provider import DefaultJSONProvider
 #from flask_login import LoginManager, UserMixin, login_user, logout_user, login_required, current_user
 import uuid
-import json
+import orjson
+import msgpack
 import os
 import hashlib
 import requests
-from datetime import datetime, timedelta
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import io
 import threading
 import time
 import signal
 import logging
 import atexit
-import subprocess
+import multiprocessing
 import random
-from ..utils import utils
+import itertools
+from .. import node
 
 atexit.register(lambda: terminate_subprocesses(None, None))
 
 # Set up logging
-logging.basicConfig(filename='metadata_server.log', level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
+logging.basicConfig(filename='metadata_server.log', level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# Serve jsonify() through orjson
+class OrjsonProvider(DefaultJSONProvider):
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, default=self.default).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
 
 app = Flask(__name__)
 app.secret_key = os.environ.get('SECRET_KEY', 'development-key')
+app.json = OrjsonProvider(app)
 
 # Configuration
-METADATA_FILE = 'metadata.json'
+METADATA_FILE = 'metadata.json'  # legacy format, only read for migration
+METADATA_SNAPSHOT = 'metadata.msgpack'
+# Chunk metadata is snapshotted column-wise (one list per field)
+CHUNK_COLUMNS = ("chunk_servers", "version", "primary", "lease_expiration")
 CHUNK_SIZE = 4194304  # 4MB chunks
 NODE_MAP = {
     "node1": "http://localhost:5001",
@@ -33,38 +49,27 @@ NODE_MAP = {
     "node3": "http://localhost:5003"
 }
 
+# Shared keep-alive connection pool for all node requests
+SESSION = requests.Session()
+SESSION.mount("http://", HTTPAdapter(pool_connections=len(NODE_MAP), pool_maxsize=64,
+                                     max_retries=Retry(total=2, backoff_factor=0.1)))
+
+REPLICA_COUNT = 2
+_RR = itertools.cycle(list(NODE_MAP.keys()))
+_RR_LOCK = threading.Lock()
+
 ports = [5001, 5002, 5003]
 processes = []
 LEASE_DURATION = 60 #seconds
 
+# Node servers run as child processes of the metadata server
+MP_CONTEXT = multiprocessing.get_context("spawn")
+
 # Function to run node.py with a specific port.
 def run_node(port):
-    pid_file = f"node_{port}.pid"
-    if os.path.exists(pid_file):
-        with open(pid_file, 'r') as f:
-            pid = int(f.read().strip())
-            try:
-                os.kill(pid, 0)  # Check if the process with this PID is running
-            except OSError:
-                # Process does not exist, remove stale pid file
-                try:
-                    os.remove(pid_file)
-                    logging.info(f"Removed stale PID file for port {port}")
-                except Exception as e:
-                    logging.error(f"Error removing stale PID file for port {port}: {e}")
-                    return None
-            except Exception as e:
-                logging.error(f"Error checking process for port {port}: {e}")
-                return None
-            else:
-                # Process exists, do not start a new one
-                logging.info(f"Node already running on port {port} with PID {pid}")
-                return None
     try:
-        command = ["python", os.path.join(utils.get_home_dir(), "node.py"), "-p", str(port)]  # Use 'python' instead of 'python3' on Windows
-        process = subprocess.Popen(command)
-        with open(pid_file, 'w') as f:
-            f.write(str(process.pid))
+        process = MP_CONTEXT.Process(target=node.run_node_app, args=(port,), name=f"node-{port}")
+        process.start()
         logging.info(f"Started node.py on port {port} with PID {process.pid}")
         return process
     except Exception as e:
@@ -75,54 +80,76 @@ def run_node(port):
 def terminate_subprocesses(signum, frame):
     logging.info("Terminating subprocesses...")
     for process in processes:
-        if process is None: continue
+        if process is None or not process.is_alive(): continue
         try:
             process.terminate()
-            process.wait(timeout=5)
-        except subprocess.TimeoutExpired:
-            process.kill()
+            process.join(timeout=5)
+            if process.is_alive():
+                process.kill()
         except Exception as e:
             logging.error(f"Error terminating process {process.pid}: {e}")
-    # Remove the PID file on exit
-    for port in ports:
-        pid_file = f"node_{port}.pid"
-        if os.path.exists(pid_file):
-            try:
-                os.remove(pid_file)
-                logging.info(f"Removed PID file for port {port}")
-            except Exception as e:
-                logging.error(f"Error removing PID file for port {port}: {e}")
     logging.info("All subprocesses terminated.")
     os._exit(0)
 
+def chunks_to_columns(chunk_metadata):
+    columns = {"chunk_id": list(chunk_metadata)}
+    for name in CHUNK_COLUMNS:
+        columns[name] = [info.get(name) for info in chunk_metadata.values()]
+    return columns
+
+def columns_to_chunks(columns):
+    rows = zip(*(columns[name] for name in CHUNK_COLUMNS))
+    return {chunk_id: dict(zip(CHUNK_COLUMNS, row)) for chunk_id, row in zip(columns["chunk_id"], rows)}
+
 # Initialize or load metadata
 def load_metadata():
-    if os.path.exists(METADATA_FILE):
-        try:
-            with open(METADATA_FILE, 'r') as f:
-                data = json.load(f)
-                # Ensure the dictionaries are initialized if the file is new
-                if 'file_to_chunks' not in data:
-                    data['file_to_chunks'] = {}
-                if 'chunk_metadata' not in data:
-                    data['chunk_metadata'] = {}
-                return data
-        except Exception as e:
-            logging.error(f"Error loading metadata: {e}")
-    return {'file_to_chunks': {}, 'chunk_metadata': {}}
+    data = {}
+    try:
+        if os.path.exists(METADATA_SNAPSHOT):
+            with open(METADATA_SNAPSHOT, 'rb') as f:
+                snapshot = msgpack.unpackb(f.read())
+            data = {
+                'file_to_chunks': snapshot['file_to_chunks'],
+                'chunk_metadata': columns_to_chunks(snapshot['chunk_columns'])
+            }
+        elif os.path.exists(METADATA_FILE):
+            # Old JSON metadata, rewritten as a snapshot on the next save
+            with open(METADATA_FILE, 'rb') as f:
+                data = orjson.loads(f.read())
+    except Exception as e:
+        logging.error(f"Error loading metadata: {e}")
+    # Ensure the dictionaries are initialized if the file is new
+    data.setdefault('file_to_chunks', {})
+    data.setdefault('chunk_metadata', {})
+    return data
 
 
 def save_metadata(metadata):
+    snapshot = {
+        'file_to_chunks': metadata['file_to_chunks'],
+        'chunk_columns': chunks_to_columns(metadata['chunk_metadata'])
+    }
     try:
-        with open(METADATA_FILE, 'w') as f:
-            json.dump(metadata, f, indent=2)
+        with open(METADATA_SNAPSHOT, 'wb') as f:
+            f.write(msgpack.packb(snapshot))
     except Exception as e:
         logging.error(f"Error saving metadata: {e}")
 
+# Round robin over all nodes, REPLICA_COUNT distinct nodes per chunk
+def pick_chunk_servers():
+    replica_count = min(REPLICA_COUNT, len(NODE_MAP))
+    chunk_servers = []
+    with _RR_LOCK:
+        while len(chunk_servers) < replica_count:
+            node_id = next(_RR)
+            if node_id not in chunk_servers:
+                chunk_servers.append(node_id)
+    return chunk_servers
+
 # Asynchronous function for uploading chunks
 def async_upload_chunk(node_url, chunk_data, chunk_id):
     try:
-        response = requests.post(
+        response = SESSION.post(
             f"{node_url}/chunk",
             data=chunk_data,
             headers={"X-Chunk-ID": chunk_id}
@@ -149,7 +176,7 @@ def reconcile_chunks():
                     for node_id in chunk_servers:
                         try:
                             # Verify chunk exists
-                            response = requests.get(f"{NODE_MAP[node_id]}/chunk/{chunk_id}/exists")
+                            response = SESSION.get(f"{NODE_MAP[node_id]}/chunk/{chunk_id}/exists")
                             if response.status_code != 200 or not bool(response.json().get("exists")):
                                 logging.info(f"Chunk {chunk_id} missing on {node_id}, initiating repair")
                                 # Repair logic (simplified example)
@@ -162,7 +189,7 @@ def reconcile_chunks():
                                     logging.error(f"Chunk {chunk_id} missing on {node_id}, and no other replicas exist.")
                                     continue
 
-                                backup_response = requests.get(f"{NODE_MAP[backup_node_id]}/chunk/{chunk_id}")
+                                backup_response = SESSION.get(f"{NODE_MAP[backup_node_id]}/chunk/{chunk_id}")
                                 if backup_response.status_code == 200:
                                     async_upload_chunk(NODE_MAP[node_id], backup_response.content, chunk_id)
                                 else:
@@ -192,21 +219,14 @@ def create_file():
     chunks = [str(uuid.uuid4()) for _ in range(chunk_count)]
     file_to_chunks[file_path] = chunks
 
-    available_nodes = list(NODE_MAP.keys()) # get the node IDs
-
     for chunk_id in chunks:
-        # Choose 2 random nodes for each chunk
-        chunk_servers = []
-        # Ensure a copy exists on two nodes, you can change for more redundancy.
-        for i in range(2):
-            node_id = available_nodes[i % len(available_nodes)] # simple round robin assignment.  Change if needed.
-            chunk_servers.append(node_id)
+        chunk_servers = pick_chunk_servers()
 
         chunk_metadata[chunk_id] = {
             "chunk_servers": chunk_servers,
             "version": 0,
             "primary": chunk_servers[0],
-            "lease_expiration": (datetime.now() + timedelta(seconds=LEASE_DURATION)).isoformat()
+            "lease_expiration": int(time.time()) + LEASE_DURATION  # UNIX epoch seconds
         }
 
     metadata['file_to_chunks'] = file_to_chunks
@@ -236,9 +256,12 @@ def get_file_metadata():
 
     for chunk_id in chunk_ids:
         if chunk_id in chunk_metadata:
+            # Shuffle a copy so clients reading the first server spread load over replicas
+            chunk_servers = list(chunk_metadata[chunk_id]["chunk_servers"])
+            random.shuffle(chunk_servers)
             file_metadata["chunks"].append({
                 "chunk_id": chunk_id,
-                "chunk_servers": chunk_metadata[chunk_id]["chunk_servers"]
+                "chunk_servers": chunk_servers
             })
     return jsonify({
         "path": file_path,
@@ -320,7 +343,7 @@ def run_metadata():
     threading.Thread(target=reconcile_chunks, daemon=True).start()
     
     try:
-        app.run(host='0.0.0.0', port=5000, debug=True, use_reloader=False)
+        app.run(host='0.0.0.0', port=5000, debug=False, threaded=True)
     except KeyboardInterrupt:
         logging.info("Server interrupted by user.")
     except Exception as e:
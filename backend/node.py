@@ -1,19 +1,110 @@
 from flask import Flask, request, jsonify, send_file, make_response
 import os
-import io
 import uuid
 import argparse
+import mmap
+import hashlib
+import threading
+import time
+import requests
+
+try:
+    from blake3 import blake3
+except ImportError:
+    blake3 = None
 
 app = Flask(__name__)
 
 # Configuration
 CHUNK_STORAGE_DIR = 'chunks'
 CHUNK_SIZE = 4194304  # 4MB chunks
+ALIGNMENT = mmap.PAGESIZE  # O_DIRECT needs page-aligned buffers and lengths
+HEARTBEAT_INTERVAL = 10  # seconds between heartbeats to the coordinator
 
 def is_node_healthy():
     # For now, let's just return True if the process is running
     return True
 
+# Chunks are write-once/read-few, so keep them out of the page cache.
+def drop_page_cache(fd):
+    if hasattr(os, 'posix_fadvise'):
+        os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+
+def drop_chunk_cache(chunk_path):
+    try:
+        fd = os.open(chunk_path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        drop_page_cache(fd)
+    finally:
+        os.close(fd)
+
+def write_chunk_file(chunk_path, chunk_data):
+    size = len(chunk_data)
+    if hasattr(os, 'O_DIRECT'):
+        # Anonymous mmap is page-aligned; pad the length up to the alignment
+        # and truncate the file back to the real size afterwards.
+        aligned_size = (size + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+        buf = mmap.mmap(-1, aligned_size)
+        try:
+            buf.write(chunk_data)
+            fd = os.open(chunk_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC | os.O_DIRECT, 0o644)
+        except OSError:
+            # Filesystem (e.g. tmpfs) does not support O_DIRECT, use buffered I/O
+            buf.close()
+        else:
+            try:
+                view = memoryview(buf)
+                written = 0
+                while written < aligned_size:
+                    written += os.write(fd, view[written:])
+                view.release()
+                os.ftruncate(fd, size)
+            finally:
+                os.close(fd)
+                buf.close()
+            return
+
+    with open(chunk_path, 'wb') as chunk_file:
+        chunk_file.write(chunk_data)
+        chunk_file.flush()
+        os.fsync(chunk_file.fileno())
+        drop_page_cache(chunk_file.fileno())
+
+# hashlib.sha256 uses SHA-NI through OpenSSL where available; blake3 is faster still.
+def chunk_digest(data, algorithm):
+    if algorithm == 'blake3':
+        return blake3(data).hexdigest()
+    return hashlib.sha256(data).hexdigest()
+
+def stored_chunk_digest(chunk_path, algorithm):
+    if not os.path.exists(chunk_path) or os.path.getsize(chunk_path) == 0:
+        return None
+    with open(chunk_path, 'rb') as chunk_file:
+        with mmap.mmap(chunk_file.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            with memoryview(mm) as mv:
+                return chunk_digest(mv, algorithm)
+
+def stored_chunk_ids():
+    return sorted(os.listdir(CHUNK_STORAGE_DIR))
+
+# Digest of the chunk IDs this node holds; the coordinator compares it against its metadata
+def chunk_set_digest(chunk_ids):
+    return hashlib.sha256("\n".join(sorted(chunk_ids)).encode()).hexdigest()
+
+def send_heartbeats(coordinator_url, node_id):
+    session = requests.Session()
+    while True:
+        try:
+            session.post(f"{coordinator_url}/heartbeat", json={
+                "node_id": node_id,
+                "digest": chunk_set_digest(stored_chunk_ids())
+            }, timeout=5)
+        except Exception as e:
+            print(f"Error sending heartbeat: {e}")
+        time.sleep(HEARTBEAT_INTERVAL)
+
 @app.route('/')
 def index():
     return jsonify({"message": "Node server is running"}), 200
@@ -36,10 +127,18 @@ def upload_chunk():
         return jsonify({"error": "No chunk data provided"}), 400
 
     chunk_path = os.path.join(CHUNK_STORAGE_DIR, chunk_id)
-    
+    # Both copies are hashed here, so use the fastest hash available
+    algorithm = 'blake3' if blake3 is not None else 'sha256'
+
     try:
-        with open(chunk_path, 'wb') as chunk_file:
-            chunk_file.write(chunk_data)
+        # Skip the write if an identical copy is already in place (repair/reconcile).
+        # The body is only hashed when a stored copy of the same size exists, and is
+        # compared by its own hash: the client's hash header isn't trusted for this
+        if (os.path.exists(chunk_path) and os.path.getsize(chunk_path) == len(chunk_data)
+                and stored_chunk_digest(chunk_path, algorithm) == chunk_digest(chunk_data, algorithm)):
+            print(f"Chunk {chunk_id} already up to date")
+            return jsonify({"message": "Chunk already exists", "chunk_id": chunk_id}), 200
+        write_chunk_file(chunk_path, chunk_data)
     except Exception as e:
         print(f"Error uploading chunk {chunk_id}: {e}")
         return jsonify({"error": str(e)}), 500
@@ -55,20 +154,28 @@ def download_chunk(chunk_id):
         print(f"Chunk {chunk_id} not found")
         return jsonify({"error": "Chunk not found"}), 404
 
+    # HEAD is an existence probe, answer it without reading the chunk
+    if request.method == 'HEAD':
+        response = make_response('', 200)
+        response.headers['Content-Length'] = str(os.path.getsize(chunk_path))
+        return response
+
     try:
-        with open(chunk_path, 'rb') as chunk_file:
-            chunk_data = chunk_file.read()
+        # Serve the chunk straight from disk: Werkzeug wraps the file with
+        # wsgi.file_wrapper, which WSGI servers like gunicorn turn into sendfile(2)
+        response = send_file(
+            chunk_path,
+            as_attachment=True,
+            download_name=chunk_id,
+            mimetype='application/octet-stream'
+        )
     except Exception as e:
         print(f"Error downloading chunk {chunk_id}: {e}")
         return jsonify({"error": str(e)}), 500
 
+    response.call_on_close(lambda: drop_chunk_cache(chunk_path))
     print(f"Chunk {chunk_id} downloaded successfully")
-    return send_file(
-        io.BytesIO(chunk_data),
-        as_attachment=True,
-        download_name=chunk_id,
-        mimetype='application/octet-stream'
-    )
+    return response
 
 @app.route('/chunk/<chunk_id>', methods=['DELETE'])
 def delete_chunk(chunk_id):
@@ -98,20 +205,75 @@ def check_chunk_exists(chunk_id):
         print(f"Chunk {chunk_id} does not exist")
         return jsonify({"exists": False}), 200
 
-if __name__ == '__main__':
-    parser = argparse.ArgumentParser(description="DFS Node Server")
-    parser.add_argument("-p", "--port", type=int, default=5001, help="Port number (default: 5001)")
-    args = parser.parse_args()
-    #print(f"Node server port: {args.port}")
-    CHUNK_STORAGE_DIR = os.path.join("chunks", str(args.port))
+# Chunk IDs from a JSON body, unlike <chunk_id> in a URL, can contain path separators;
+# only accept plain file names so a request can't reach outside CHUNK_STORAGE_DIR
+def valid_chunk_id(chunk_id):
+    if not isinstance(chunk_id, str) or chunk_id in ('', '.', '..'):
+        return False
+    if os.sep in chunk_id or (os.altsep and os.altsep in chunk_id):
+        return False
+    return chunk_id == os.path.basename(chunk_id)
+
+# Batched existence check: JSON list of chunk IDs in, {chunk_id: bool} out
+@app.route('/chunks/exists', methods=['POST'])
+def check_chunks_exist():
+    chunk_ids = request.get_json(silent=True)
+    if not isinstance(chunk_ids, list):
+        return jsonify({"error": "Expected a JSON list of chunk IDs"}), 400
+    if not all(valid_chunk_id(chunk_id) for chunk_id in chunk_ids):
+        return jsonify({"error": "Invalid chunk ID"}), 400
+    return jsonify({chunk_id: os.path.exists(os.path.join(CHUNK_STORAGE_DIR, chunk_id)) for chunk_id in chunk_ids}), 200
+
+@app.route('/chunks', methods=['GET'])
+def list_chunks():
+    return jsonify(stored_chunk_ids()), 200
+
+# Batched delete: JSON list of chunk IDs in, one request per node instead of per chunk
+@app.route('/chunks', methods=['DELETE'])
+def delete_chunks():
+    chunk_ids = request.get_json(silent=True)
+    if not isinstance(chunk_ids, list):
+        return jsonify({"error": "Expected a JSON list of chunk IDs"}), 400
+    if not all(valid_chunk_id(chunk_id) for chunk_id in chunk_ids):
+        return jsonify({"error": "Invalid chunk ID"}), 400
+
+    deleted, missing, errors = [], [], {}
+    for chunk_id in chunk_ids:
+        try:
+            os.remove(os.path.join(CHUNK_STORAGE_DIR, chunk_id))
+            deleted.append(chunk_id)
+        except FileNotFoundError:
+            missing.append(chunk_id)
+        except Exception as e:
+            print(f"Error deleting chunk {chunk_id}: {e}")
+            errors[chunk_id] = str(e)
+
+    print(f"Deleted {len(deleted)} chunks")
+    return jsonify({"deleted": deleted, "missing": missing, "errors": errors}), 500 if errors else 200
+
+def run_node_app(port, coordinator_url=None, node_id=None):
+    global CHUNK_STORAGE_DIR
+    CHUNK_STORAGE_DIR = os.path.join("chunks", str(port))
 
     # Ensure chunk storage directory exists
     if not os.path.exists(CHUNK_STORAGE_DIR):
         os.makedirs(CHUNK_STORAGE_DIR)
 
+    if coordinator_url and node_id:
+        threading.Thread(target=send_heartbeats, args=(coordinator_url, node_id), daemon=True).start()
+
     try:
-        app.run(host='127.0.0.1', port=args.port, debug=False, use_reloader=False)
+        app.run(host='127.0.0.1', port=port, debug=False, use_reloader=False)
     except KeyboardInterrupt:
         print("Node server interrupted by user.")
     except Exception as e:
-        print(f"Unexpected error: {e}")
\ No newline at end of file
+        print(f"Unexpected error: {e}")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="DFS Node Server")
+    parser.add_argument("-p", "--port", type=int, default=5001, help="Port number (default: 5001)")
+    parser.add_argument("--coordinator", help="URL of the server to send heartbeats to")
+    parser.add_argument("--node-id", help="Node ID to report in heartbeats")
+    args = parser.parse_args()
+    #print(f"Node server port: {args.port}")
+    run_node_app(args.port, args.coordinator, args.node_id)
\ No newline at end of file
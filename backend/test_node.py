@@ -0,0 +1,23 @@
+import node
+
+def test_delete_chunks_rejects_path_traversal(tmp_path):
+	chunk_dir = tmp_path / "chunks"
+	chunk_dir.mkdir()
+	victim = tmp_path / "victim.txt"
+	victim.write_text("keep me")
+	node.CHUNK_STORAGE_DIR = str(chunk_dir)
+
+	response = node.app.test_client().delete('/chunks', json=["../victim.txt"])
+
+	assert response.status_code == 400
+	assert victim.exists()
+
+def test_chunks_exist_rejects_path_traversal(tmp_path):
+	chunk_dir = tmp_path / "chunks"
+	chunk_dir.mkdir()
+	(tmp_path / "victim.txt").write_text("secret")
+	node.CHUNK_STORAGE_DIR = str(chunk_dir)
+
+	response = node.app.test_client().post('/chunks/exists', json=["../victim.txt"])
+
+	assert response.status_code == 400
@@ -4,13 +4,28 @@ from flask import Flask, request, jsonify
 import uuid
 import sqlite3
 import hashlib
+import threading
 from datetime import datetime
 
 app = Flask(__name__)
 
+DB_PATH = 'metadata.db'
+_local = threading.local()
+
+# One long-lived WAL-mode connection per thread
+def get_db():
+    conn = getattr(_local, 'conn', None)
+    if conn is None:
+        conn = sqlite3.connect(DB_PATH, check_same_thread=False, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        _local.conn = conn
+    return conn
+
 # Database setup
 def init_db():
-    conn = sqlite3.connect('metadata.db')
+    conn = get_db()
     c = conn.cursor()
     c.execute('''
     CREATE TABLE IF NOT EXISTS files (
@@ -29,8 +44,9 @@ def init_db():
         node_id TEXT,
         FOREIGN KEY (file_id) REFERENCES files (id)
     )''')
-    conn.commit()
-    conn.close()
+    
+    c.execute("CREATE INDEX IF NOT EXISTS idx_chunks_file ON chunks(file_id, chunk_number)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_files_name ON files(filename)")
 
 @app.before_first_request
 def setup():
@@ -42,36 +58,37 @@ def create_file():
     file_data = request.json
     file_id = str(uuid.uuid4())
     
-    conn = sqlite3.connect('metadata.db')
-    c = conn.cursor()
-    c.execute(
-        "INSERT INTO files VALUES (?, ?, ?, ?, ?)",
-        (file_id, file_data['filename'], file_data['size'], 
-         datetime.now().isoformat(), file_data['hash'])
-    )
-    conn.commit()
-    
     # Create chunk entries
     chunk_count = (file_data['size'] + 4194304 - 1) // 4194304  # 4MB chunks
     chunks = []
+    rows = []
     
     for i in range(chunk_count):
         chunk_id = str(uuid.uuid4())
         # Select a node (simple round-robin for this example)
         node_id = f"node_{i % 3 + 1}"
         
-        c.execute(
-            "INSERT INTO chunks VALUES (?, ?, ?, ?)",
-            (chunk_id, file_id, i, node_id)
-        )
+        rows.append((chunk_id, file_id, i, node_id))
         chunks.append({
             'id': chunk_id,
             'node_id': node_id,
             'chunk_number': i
         })
     
-    conn.commit()
-    conn.close()
+    # Single transaction (one fsync) for the file and all of its chunks
+    c = get_db().cursor()
+    c.execute("BEGIN")
+    try:
+        c.execute(
+            "INSERT INTO files VALUES (?, ?, ?, ?, ?)",
+            (file_id, file_data['filename'], file_data['size'], 
+             datetime.now().isoformat(), file_data['hash'])
+        )
+        c.executemany("INSERT INTO chunks VALUES (?, ?, ?, ?)", rows)
+        c.execute("COMMIT")
+    except Exception:
+        c.execute("ROLLBACK")
+        raise
     
     return jsonify({
         'file_id': file_id,
@@ -80,9 +97,7 @@ def create_file():
 
 @app.route('/file/<file_id>', methods=['GET'])
 def get_file_metadata(file_id):
-    conn = sqlite3.connect('metadata.db')
-    conn.row_factory = sqlite3.Row
-    c = conn.cursor()
+    c = get_db().cursor()
     
     c.execute("SELECT * FROM files WHERE id = ?", (file_id,))
     file = dict(c.fetchone())
@@ -90,8 +105,6 @@ def get_file_metadata(file_id):
     c.execute("SELECT * FROM chunks WHERE file_id = ? ORDER BY chunk_number", (file_id,))
     chunks = [dict(row) for row in c.fetchall()]
     
-    conn.close()
-    
     return jsonify({
         'file': file,
         'chunks': chunks
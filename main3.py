@@ -1,16 +1,30 @@
 # --- MAIN SERVER (main_server.py) ---
 
-from flask import Flask, request, jsonify, render_template, redirect, url_for, flash, send_file
+from flask import Flask, request, jsonify, render_template, redirect, url_for, flash, Response, stream_with_context, g
+from flask.json.provider import DefaultJSONProvider
 import uuid
-import json
+import orjson
 import os
 import hashlib
 import requests
+from requests.adapters import HTTPAdapter
 from datetime import datetime
-import io
+import bisect
+import functools
 from templates import templates
 
+try:
+    from blake3 import blake3
+except ImportError:
+    blake3 = None
+
+try:
+    from pyeclib.ec_iface import ECDriver
+except ImportError:
+    ECDriver = None
+
 import subprocess
+import threading
 
 def run_node(port):
     """Function to run node.py with a specific port."""
@@ -18,8 +32,8 @@ def run_node(port):
         # Construct the command to run node.py with the -p argument
         command = ["python3", "node.py", "-p", str(port)]
         
-        # Use subprocess.Popen to start the process
-        process = subprocess.Popen(command, shell=True, creationflags=subprocess.CREATE_NEW_PROCESS_GROUP)
+        # Start the process directly, without an intermediate shell
+        process = subprocess.Popen(command)
         
         print(f"Started node.py on port {port} with PID {process.pid}")
         
@@ -30,30 +44,308 @@ def run_node(port):
         print(f"Error starting node.py on port {port}: {e}")
         return None
 
+# Serve jsonify() through orjson
+class OrjsonProvider(DefaultJSONProvider):
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, default=self.default).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
 app = Flask(__name__)
 app.secret_key = os.environ.get('SECRET_KEY', 'development-key')
+app.json = OrjsonProvider(app)
+app.config['MAX_CONTENT_LENGTH'] = 10 * 1024 * 1024 * 1024  # 10GB uploads, spooled to disk by Werkzeug
 
 # Configuration
 METADATA_FILE = 'metadata.json'
 CHUNK_SIZE = 4194304  # 4MB chunks
+STREAM_BLOCK_SIZE = 1048576  # 1MB pieces when streaming chunks to the client
 NODE_MAP = {
     "node1": "http://localhost:5001",
     "node2": "http://localhost:5002",
     "node3": "http://localhost:5003"
 }
 
+# Reed-Solomon erasure coding: each chunk is split into EC_K data + EC_M parity
+# fragments, one per node, and any EC_K of them rebuild it (1.5x storage instead
+# of 2x for two full replicas). Falls back to replication without pyeclib.
+EC_K = 2
+EC_M = 1
+
+def make_ec_driver():
+    if ECDriver is None:
+        return None
+    try:
+        return ECDriver(k=EC_K, m=EC_M, ec_type='liberasurecode_rs_vand')
+    except Exception as e:
+        print(f"Erasure coding unavailable, using replication: {e}")
+        return None
+
+EC_DRIVER = make_ec_driver()
+
+# Header the nodes use to skip re-hashing a chunk whose ID is its content hash
+HASH_HEADER = "X-Chunk-BLAKE3" if blake3 is not None else "X-Chunk-SHA256"
+
+# Shared keep-alive connection pool for all node requests
+SESSION = requests.Session()
+SESSION.mount("http://", HTTPAdapter(pool_connections=16, pool_maxsize=64))
+SESSION.headers.update({"User-Agent": "dfs-main-server"})
+
+
+
+METADATA_LOG = 'metadata.log'
+COMPACT_EVERY = 1000  # log records between snapshots
+
+# Metadata lives in memory: the last snapshot plus the replayed mutation log
+_META = {"data": None, "log_records": 0, "version": 0}
+_META_LOCK = threading.Lock()
+# Sorted file paths, so prefix (directory) lookups are a bisect instead of a full scan
+PATH_INDEX = []
+# Directory tree: parent dir -> child dirs, plus a per-dir file count to know when to drop one
+DIR_INDEX = {}
+DIR_FILE_COUNTS = {}
+# Chunks are content-addressed and shared between files: chunk_id -> number of files
+# (and in-flight uploads, see pin_chunk) using it
+CHUNK_REFS = {}
+
+def apply_record(metadata, record):
+    if record["op"] == "put":
+        metadata[record["path"]] = record["info"]
+    else:
+        metadata.pop(record["path"], None)
 
+# '/dfs/a/b.txt' -> [('/', '/dfs/'), ('/dfs/', '/dfs/a/')]
+def parent_dirs(file_path):
+    parts = file_path.split('/')[:-1]
+    return [('/'.join(parts[:i]) + '/', '/'.join(parts[:i + 1]) + '/') for i in range(1, len(parts))]
+
+def index_dirs(file_path, delta):
+    for parent, child in parent_dirs(file_path):
+        count = DIR_FILE_COUNTS.get(child, 0) + delta
+        if count > 0:
+            DIR_FILE_COUNTS[child] = count
+            DIR_INDEX.setdefault(parent, set()).add(child)
+        else:
+            DIR_FILE_COUNTS.pop(child, None)
+            children = DIR_INDEX.get(parent)
+            if children is not None:
+                children.discard(child)
+                if not children:
+                    del DIR_INDEX[parent]
+
+# Returns the chunks that are no longer referenced by any file
+def index_chunks(file_info, delta):
+    released = set()
+    for chunk_id in {chunk_id for replica in file_info["replicas"] for chunk_id in replica["chunk_ids"]}:
+        refs = CHUNK_REFS.get(chunk_id, 0) + delta
+        if refs > 0:
+            CHUNK_REFS[chunk_id] = refs
+        else:
+            CHUNK_REFS.pop(chunk_id, None)
+            released.add(chunk_id)
+    return released
+
+def _load_locked():
+    if _META["data"] is None:
+        data = {}
+        if os.path.exists(METADATA_FILE):
+            with open(METADATA_FILE, 'rb') as f:
+                data = orjson.loads(f.read())
+        records = 0
+        if os.path.exists(METADATA_LOG):
+            with open(METADATA_LOG, 'r+b') as f:
+                end = 0  # end of the last complete record
+                for line in iter(f.readline, b''):
+                    try:
+                        if not line.endswith(b"\n"):
+                            raise ValueError("unterminated record")
+                        record = orjson.loads(line)
+                    except ValueError:
+                        # Torn write at the end of the log: cut it off, otherwise the
+                        # next append lands on the same line and is lost on replay
+                        f.truncate(end)
+                        break
+                    apply_record(data, record)
+                    records += 1
+                    end = f.tell()
+        _META["data"] = data
+        _META["log_records"] = records
+        _META["version"] += 1
+        PATH_INDEX[:] = sorted(data)
+        DIR_INDEX.clear()
+        DIR_FILE_COUNTS.clear()
+        CHUNK_REFS.clear()
+        for path, file_info in data.items():
+            index_dirs(path, 1)
+            index_chunks(file_info, 1)
+    return _META["data"]
+
+# Chunks a delete is removing from the nodes: chunk_id -> deletes in flight.
+# Uploads wait for these rather than reuse a copy that is about to disappear
+DELETING_CHUNKS = {}
+_DELETES_DONE = threading.Condition(_META_LOCK)
+
+# Reference a chunk an upload is about to reuse, so no delete can remove it before
+# the file is recorded; waits out a delete of the same chunk that is already under way
+def pin_chunk(chunk_id):
+    with _DELETES_DONE:
+        _load_locked()
+        CHUNK_REFS[chunk_id] = CHUNK_REFS.get(chunk_id, 0) + 1
+        while chunk_id in DELETING_CHUNKS:
+            _DELETES_DONE.wait()
+
+def unpin_chunks(chunk_ids):
+    with _META_LOCK:
+        for chunk_id in chunk_ids:
+            refs = CHUNK_REFS.get(chunk_id, 0) - 1
+            if refs > 0:
+                CHUNK_REFS[chunk_id] = refs
+            else:
+                CHUNK_REFS.pop(chunk_id, None)
+
+# Of the chunks a delete released, claim the ones no upload has pinned since
+def claim_deletes(chunk_ids):
+    with _META_LOCK:
+        claimed = {chunk_id for chunk_id in chunk_ids if chunk_id not in CHUNK_REFS}
+        for chunk_id in claimed:
+            DELETING_CHUNKS[chunk_id] = DELETING_CHUNKS.get(chunk_id, 0) + 1
+        return claimed
+
+def finish_deletes(chunk_ids):
+    with _DELETES_DONE:
+        for chunk_id in chunk_ids:
+            count = DELETING_CHUNKS.pop(chunk_id, 1) - 1
+            if count > 0:
+                DELETING_CHUNKS[chunk_id] = count
+        _DELETES_DONE.notify_all()
 
 # Initialize or load metadata
 def load_metadata():
-    if os.path.exists(METADATA_FILE):
-        with open(METADATA_FILE, 'r') as f:
-            return json.load(f)
-    return {}
+    with _META_LOCK:
+        # Shallow copy, callers only read top-level entries
+        return dict(_load_locked())
 
+# Write a full snapshot and start a new log (called with _META_LOCK held)
 def save_metadata(metadata):
-    with open(METADATA_FILE, 'w') as f:
-        json.dump(metadata, f, indent=2)
+    tmp_file = METADATA_FILE + ".tmp"
+    with open(tmp_file, 'wb') as f:
+        f.write(orjson.dumps(metadata, option=orjson.OPT_INDENT_2))
+        f.flush()
+        os.fsync(f.fileno())
+    # Readers never see a partially written snapshot, even after a crash
+    os.replace(tmp_file, METADATA_FILE)
+    open(METADATA_LOG, 'w').close()
+
+# Append one mutation to the log; O(1) instead of rewriting every file entry
+def log_metadata(record):
+    with _META_LOCK:
+        metadata = _load_locked()
+        with open(METADATA_LOG, 'ab') as f:
+            f.write(orjson.dumps(record) + b"\n")
+        old_info = metadata.get(record["path"])
+        apply_record(metadata, record)
+        new_info = metadata.get(record["path"])
+        if old_info is None and new_info is not None:
+            bisect.insort(PATH_INDEX, record["path"])
+            index_dirs(record["path"], 1)
+        elif old_info is not None and new_info is None:
+            del PATH_INDEX[bisect.bisect_left(PATH_INDEX, record["path"])]
+            index_dirs(record["path"], -1)
+        # Count the new references first so chunks kept by an overwrite aren't released
+        released = set()
+        if new_info is not None:
+            index_chunks(new_info, 1)
+        if old_info is not None:
+            released = index_chunks(old_info, -1)
+        _META["log_records"] += 1
+        _META["version"] += 1
+        if _META["log_records"] >= COMPACT_EVERY:
+            save_metadata(metadata)
+            _META["log_records"] = 0
+        return released
+
+# Bumped on every mutation, so caches keyed on it never serve stale metadata
+def metadata_version():
+    with _META_LOCK:
+        _load_locked()
+        return _META["version"]
+
+def files_with_prefix(prefix):
+    with _META_LOCK:
+        metadata = _load_locked()
+        lo = bisect.bisect_left(PATH_INDEX, prefix)
+        hi = bisect.bisect_left(PATH_INDEX, prefix + '\U0010ffff')
+        return {path: metadata[path] for path in PATH_INDEX[lo:hi]}
+
+def subdirectories(directory):
+    if not directory.endswith('/'):
+        directory += '/'
+    with _META_LOCK:
+        _load_locked()
+        return sorted(DIR_INDEX.get(directory, ()))
+
+def put_file(file_path, file_info):
+    return log_metadata({"op": "put", "path": file_path, "info": file_info})
+
+def remove_file(file_path):
+    return log_metadata({"op": "delete", "path": file_path})
+
+# Hash the whole chunk in one call: both hashlib (SHA-NI via OpenSSL) and blake3
+# (SIMD) release the GIL for large buffers
+def chunk_hash(chunk_data):
+    if blake3 is not None:
+        return blake3(chunk_data).hexdigest()
+    return hashlib.sha256(chunk_data).hexdigest()
+
+# Upload a chunk unless the node already holds it (chunk IDs are content hashes);
+# callers pin the chunk first, so a copy being reused can't be deleted underneath them
+def store_chunk(node_url, chunk_data, chunk_id):
+    if SESSION.head(f"{node_url}/chunk/{chunk_id}").status_code == 200:
+        return
+    response = SESSION.post(
+        f"{node_url}/chunk",
+        data=chunk_data,
+        headers={"X-Chunk-ID": chunk_id, HASH_HEADER: chunk_id}
+    )
+    response.raise_for_status()
+
+# Open a streamed chunk response, falling back to the backup replica
+def open_chunk(file_info, node_id, chunk_id):
+    response = SESSION.get(f"{NODE_MAP[node_id]}/chunk/{chunk_id}", stream=True)
+    if response.status_code != 200 and len(file_info["replicas"]) > 1:
+        response.close()
+        backup_node = file_info["replicas"][1]["node_id"]
+        response = SESSION.get(f"{NODE_MAP[backup_node]}/chunk/{chunk_id}", stream=True)
+    if response.status_code != 200:
+        response.close()
+        raise IOError(f"Failed to retrieve chunk {chunk_id}")
+    return response
+
+# Rebuild an erasure-coded chunk from the first k fragments that can be fetched
+def read_erasure_chunk(file_info, index):
+    k = file_info["erasure"]["k"]
+    fragments = []
+    for replica in file_info["replicas"]:
+        chunk_id = replica["chunk_ids"][index]
+        try:
+            response = SESSION.get(f"{NODE_MAP[replica['node_id']]}/chunk/{chunk_id}")
+        except Exception as e:
+            print(f"Error fetching fragment {chunk_id}: {str(e)}")
+            continue
+        if response.status_code == 200:
+            fragments.append(response.content)
+            if len(fragments) == k:
+                break
+    if len(fragments) < k:
+        raise IOError(f"Failed to retrieve enough fragments for chunk {index}")
+    return EC_DRIVER.decode(fragments)
+
+# Timestamp for metadata written by this request, formatted once per request
+def request_timestamp():
+    if "now_iso" not in g:
+        g.now_iso = datetime.now().isoformat()
+    return g.now_iso
 
 # Web interface routes
 @app.route('/')
@@ -63,24 +355,18 @@ def index():
 @app.route('/browse')
 def browse():
     directory = request.args.get('dir', '/')
-    metadata = load_metadata()
     
-    # Filter files by directory prefix
-    files = {path: info for path, info in metadata.items() 
-             if path.startswith(directory)}
+    # Only files directly in this directory; nested ones are reached through subdirectories
+    parent = directory if directory.endswith('/') else directory + '/'
+    files = {path: info for path, info in files_with_prefix(directory).items()
+             if path.rsplit('/', 1)[0] + '/' == parent}
     
-    # Extract directories
-    directories = set()
-    for path in files.keys():
-        parts = path.split('/')
-        if len(parts) > 2:  # Skip the root directory
-            parent_dir = '/'.join(parts[:-1]) + '/'
-            if parent_dir.startswith(directory) and parent_dir != directory:
-                directories.add(parent_dir)
+    # Subdirectories come from the precomputed directory index
+    directories = subdirectories(directory)
     
     return render_template('browse.html', 
                           files=files, 
-                          directories=sorted(directories),
+                          directories=directories,
                           current_dir=directory)
 
 @app.route('/upload', methods=['GET', 'POST'])
@@ -98,41 +384,58 @@ def upload_file():
             return redirect(request.url)
             
         if file:
-            # Read file data
-            file_data = file.read()
-            file_size = len(file_data)
             file_path = os.path.join(directory, file.filename)
             
-            # Split into chunks
-            chunks = []
-            for i in range(0, file_size, CHUNK_SIZE):
-                chunk_data = file_data[i:i+CHUNK_SIZE]
-                chunk_id = str(uuid.uuid4())
-                chunks.append(chunk_id)
+            # Stream the file in chunks
+            # Uploads are synchronous, so one buffer is reused for every chunk
+            file_size = 0
+            if EC_DRIVER is not None:
+                node_ids = list(NODE_MAP)[:EC_K + EC_M]
+            else:
+                node_ids = ["node1", "node2"]
+            # Chunk (or fragment) IDs stored on each node, in file order
+            node_chunks = {node_id: [] for node_id in node_ids}
+            # Chunks this upload reuses or stores, referenced until the file is recorded
+            pinned = []
+            try:
+                buf = bytearray(CHUNK_SIZE)
+                buf_view = memoryview(buf)
+                while True:
+                    n = file.stream.readinto(buf)
+                    if not n:
+                        break
+                    chunk_data = buf_view[:n]
+                    file_size += n
+                    if EC_DRIVER is not None:
+                        pieces = EC_DRIVER.encode(bytes(chunk_data))
+                        piece_ids = [chunk_hash(piece) for piece in pieces]
+                    else:
+                        pieces = [chunk_data] * len(node_ids)
+                        piece_ids = [chunk_hash(chunk_data)] * len(node_ids)
                 
-                # Upload to nodes (2 replicas)
-                for node_id in ["node1", "node2"]:
-                    try:
-                        response = requests.post(
-                            f"{NODE_MAP[node_id]}/chunk",
-                            data=chunk_data,
-                            headers={"X-Chunk-ID": chunk_id}
-                        )
-                    except Exception as e:
-                        flash(f"Error uploading to {node_id}: {str(e)}")
-                        return redirect(request.url)
+                    # Upload to nodes (one fragment or replica each); content-addressed
+                    # IDs mean identical chunks are stored once
+                    for node_id, piece, piece_id in zip(node_ids, pieces, piece_ids):
+                        pin_chunk(piece_id)
+                        pinned.append(piece_id)
+                        try:
+                            store_chunk(NODE_MAP[node_id], piece, piece_id)
+                        except Exception as e:
+                            flash(f"Error uploading to {node_id}: {str(e)}")
+                            return redirect(request.url)
+                        node_chunks[node_id].append(piece_id)
             
-            # Update metadata
-            metadata = load_metadata()
-            metadata[file_path] = {
-                "size": file_size,
-                "created_at": datetime.now().isoformat(),
-                "replicas": [
-                    {"node_id": "node1", "chunk_ids": chunks},
-                    {"node_id": "node2", "chunk_ids": chunks}
-                ]
-            }
-            save_metadata(metadata)
+                # Update metadata
+                file_info = {
+                    "size": file_size,
+                    "created_at": request_timestamp(),
+                    "replicas": [{"node_id": node_id, "chunk_ids": chunk_ids} for node_id, chunk_ids in node_chunks.items()]
+                }
+                if EC_DRIVER is not None:
+                    file_info["erasure"] = {"k": EC_K, "m": EC_M}
+                put_file(file_path, file_info)
+            finally:
+                unpin_chunks(pinned)
             
             flash(f"File {file.filename} uploaded successfully")
             return redirect(url_for('browse', dir=directory))
@@ -157,39 +460,42 @@ def download_file(file_path):
     replica = file_info["replicas"][0]
     node_id = replica["node_id"]
     chunk_ids = replica["chunk_ids"]
+    erasure_coded = "erasure" in file_info
     
-    # Download and combine chunks
-    file_data = bytearray()
-    for chunk_id in chunk_ids:
-        try:
-            response = requests.get(f"{NODE_MAP[node_id]}/chunk/{chunk_id}")
-            if response.status_code == 200:
-                file_data.extend(response.content)
-            else:
-                # Try another replica if available
-                if len(file_info["replicas"]) > 1:
-                    backup_replica = file_info["replicas"][1]
-                    backup_node = backup_replica["node_id"]
-                    backup_response = requests.get(f"{NODE_MAP[backup_node]}/chunk/{chunk_id}")
-                    if backup_response.status_code == 200:
-                        file_data.extend(backup_response.content)
-                    else:
-                        flash(f"Failed to retrieve chunk {chunk_id}")
-                        return redirect(url_for('browse'))
-                else:
-                    flash(f"Failed to retrieve chunk {chunk_id}")
-                    return redirect(url_for('browse'))
-        except Exception as e:
-            flash(f"Error downloading chunk: {str(e)}")
-            return redirect(url_for('browse'))
+    if erasure_coded and EC_DRIVER is None:
+        flash("File is erasure coded but pyeclib is not available")
+        return redirect(url_for('browse'))
+    
+    # Fetch the first chunk up front so a missing file can still be reported
+    try:
+        if not chunk_ids:
+            first = None
+        elif erasure_coded:
+            first = read_erasure_chunk(file_info, 0)
+        else:
+            first = open_chunk(file_info, node_id, chunk_ids[0])
+    except Exception as e:
+        flash(f"Error downloading chunk: {str(e)}")
+        return redirect(url_for('browse'))
+    
+    # Stream chunks to the client in order instead of buffering the whole file
+    def generate():
+        for i, chunk_id in enumerate(chunk_ids):
+            if erasure_coded:
+                yield first if i == 0 else read_erasure_chunk(file_info, i)
+                continue
+            response = first if i == 0 else open_chunk(file_info, node_id, chunk_id)
+            with response:
+                yield from response.iter_content(STREAM_BLOCK_SIZE)
     
-    # Return the file
     filename = os.path.basename(file_path)
-    return send_file(
-        io.BytesIO(file_data),
-        as_attachment=True,
-        download_name=filename,
-        mimetype='application/octet-stream'
+    return Response(
+        stream_with_context(generate()),
+        mimetype='application/octet-stream',
+        headers={
+            "Content-Disposition": f'attachment; filename="{filename}"',
+            "Content-Length": str(file_info["size"])
+        }
     )
 
 @app.route('/delete/<path:file_path>', methods=['POST'])
@@ -204,11 +510,15 @@ def delete_file_web(file_path):
         flash("File not found")
         return redirect(url_for('browse'))
     
-    # Get chunk information before deletion
+    # Remove the file first; only chunks no other file references are deleted,
+    # and none an upload has pinned for reuse in the meantime
+    released = claim_deletes(remove_file(file_path))
     chunks_to_delete = []
     for replica in metadata[file_path]["replicas"]:
         node_id = replica["node_id"]
         for chunk_id in replica["chunk_ids"]:
+            if chunk_id not in released:
+                continue
             chunks_to_delete.append({
                 "node_id": node_id,
                 "chunk_id": chunk_id
@@ -217,15 +527,12 @@ def delete_file_web(file_path):
     # Delete chunks from nodes
     for chunk_info in chunks_to_delete:
         try:
-            requests.delete(
+            SESSION.delete(
                 f"{NODE_MAP[chunk_info['node_id']]}/chunk/{chunk_info['chunk_id']}"
             )
         except Exception as e:
             flash(f"Error deleting chunk: {str(e)}")
-    
-    # Remove file from metadata
-    del metadata[file_path]
-    save_metadata(metadata)
+    finish_deletes(released)
     
     flash(f"File {os.path.basename(file_path)} deleted successfully")
     return redirect(url_for('browse'))
@@ -237,11 +544,8 @@ def create_file():
     file_path = file_data['path']
     file_size = file_data['size']
     
-    # Load current metadata
-    metadata = load_metadata()
-    
     # Calculate number of chunks needed
-    chunk_count = (file_size + CHUNK_SIZE - 1)
+    chunk_count = (file_size + CHUNK_SIZE - 1) // CHUNK_SIZE
     
     # Generate chunk IDs
     chunks = [str(uuid.uuid4()) for _ in range(chunk_count)]
@@ -259,14 +563,11 @@ def create_file():
         })
     
     # Create metadata entry
-    metadata[file_path] = {
+    put_file(file_path, {
         "size": file_size,
-        "created_at": datetime.now().isoformat(),
+        "created_at": request_timestamp(),
         "replicas": replicas
-    }
-    
-    # Save updated metadata
-    save_metadata(metadata)
+    })
     
     return jsonify({
         "path": file_path,
@@ -287,16 +588,16 @@ def get_file_metadata():
         "metadata": metadata[file_path]
     })
 
+# Encoded listings, reused until the metadata version changes
+@functools.lru_cache(maxsize=256)
+def serialize_file_list(directory, version):
+    return orjson.dumps(files_with_prefix(directory))
+
 @app.route('/api/list', methods=['GET'])
 def list_files():
     directory = request.args.get('directory', '/')
-    metadata = load_metadata()
-    
-    # Filter files by directory prefix
-    files = {path: info for path, info in metadata.items() 
-             if path.startswith(directory)}
     
-    return jsonify(files)
+    return Response(serialize_file_list(directory, metadata_version()), mimetype='application/json')
 
 @app.route('/api/file', methods=['DELETE'])
 def delete_file():
@@ -306,33 +607,35 @@ def delete_file():
     if file_path not in metadata:
         return jsonify({"error": "File not found"}), 404
     
-    # Get chunk information before deletion
+    # Remove the file first; only chunks no other file references are deleted
+    released = remove_file(file_path)
     chunks_to_delete = []
     for replica in metadata[file_path]["replicas"]:
         node_id = replica["node_id"]
         for chunk_id in replica["chunk_ids"]:
+            if chunk_id not in released:
+                continue
             chunks_to_delete.append({
                 "node_id": node_id,
                 "chunk_id": chunk_id
             })
     
-    # Remove file from metadata
-    del metadata[file_path]
-    save_metadata(metadata)
-    
     # Return information about chunks to clean up
     return jsonify({
         "deleted": file_path,
         "chunks_to_delete": chunks_to_delete
     })
 
-# Templates for the web interface
+# Templates for the web interface, encoded once since they never change at runtime
+TEMPLATE_BYTES = {name: content.encode() for name, content in templates.items()}
+TEMPLATE_LIST_BYTES = orjson.dumps({"available_templates": list(templates.keys())})
+
 @app.route('/templates')
 def get_templates():    
     template_name = request.args.get('name')
-    if template_name in templates:
-        return templates[template_name]
-    return jsonify({"available_templates": list(templates.keys())})
+    if template_name in TEMPLATE_BYTES:
+        return Response(TEMPLATE_BYTES[template_name], mimetype='text/html')
+    return Response(TEMPLATE_LIST_BYTES, mimetype='application/json')
 
 if __name__ == '__main__':
     # List of ports to run node.py with
@@ -351,10 +654,17 @@ if __name__ == '__main__':
     if not os.path.exists('templates'):
         os.makedirs('templates')
         
-    # Create template files
-    for template_name, template_content in templates.items():
+    # Only rewrite templates whose content changed
+    for template_name, template_bytes in TEMPLATE_BYTES.items():
         if template_name.endswith('.html'):
-            with open(os.path.join('templates', template_name), 'w') as f:
-                f.write(template_content)
+            template_path = os.path.join('templates', template_name)
+            try:
+                with open(template_path, 'rb') as f:
+                    current = f.read()
+            except FileNotFoundError:
+                current = None
+            if current != template_bytes:
+                with open(template_path, 'wb') as f:
+                    f.write(template_bytes)
     
     app.run(host='0.0.0.0', port=5000, debug=True)
\ No newline at end of file
@@ -1,21 +1,30 @@
-from flask import Flask, request, jsonify, render_template, redirect, url_for, flash, send_file
+from flask import Flask, request, jsonify, render_template, redirect, url_for, flash, Response, stream_with_context, g
+from flask.json.provider import DefaultJSONProvider
 import uuid
-import json
+import orjson
 import os
 import hashlib
 import requests
+from requests.adapters import HTTPAdapter
 from datetime import datetime
-import io
+import bisect
+import functools
 from templates import templates
 
+try:
+    from blake3 import blake3
+except ImportError:
+    blake3 = None
+
 import subprocess
 import threading
-import time
+import queue
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
-# Function to run node.py with a specific port.
-def run_node(port):
+# Function to run node.py with a specific port; the node heartbeats back to this server.
+def run_node(port, node_id):
     try:
-        command = ["python3", "node.py", "-p", str(port)]
+        command = ["python3", "node.py", "-p", str(port), "--coordinator", "http://localhost:5000", "--node-id", node_id]
         process = subprocess.Popen(command)
         print(f"Started node.py on port {port} with PID {process.pid}")
         return process
@@ -23,62 +32,359 @@ def run_node(port):
         print(f"Error starting node.py on port {port}: {e}")
         return None
 
+# Serve jsonify() through orjson
+class OrjsonProvider(DefaultJSONProvider):
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, default=self.default).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
 app = Flask(__name__)
 app.secret_key = os.environ.get('SECRET_KEY', 'development-key')
+app.json = OrjsonProvider(app)
+app.config['MAX_CONTENT_LENGTH'] = 10 * 1024 * 1024 * 1024  # 10GB uploads, spooled to disk by Werkzeug
 
 # Configuration
 METADATA_FILE = 'metadata.json'
 CHUNK_SIZE = 4194304  # 4MB chunks
+STREAM_BLOCK_SIZE = 1048576  # 1MB pieces when streaming chunks to the client
 NODE_MAP = {
     "node1": "http://localhost:5001",
     "node2": "http://localhost:5002",
     "node3": "http://localhost:5003"
 }
 
+# Header the nodes use to skip re-hashing a chunk whose ID is its content hash
+HASH_HEADER = "X-Chunk-BLAKE3" if blake3 is not None else "X-Chunk-SHA256"
+
+# Shared keep-alive connection pool for all node requests
+SESSION = requests.Session()
+SESSION.mount("http://", HTTPAdapter(pool_connections=16, pool_maxsize=64))
+SESSION.headers.update({"User-Agent": "dfs-main-server"})
+
+# Bounded worker pool for chunk uploads and repairs
+POOL = ThreadPoolExecutor(max_workers=16)
+
+METADATA_LOG = 'metadata.log'
+COMPACT_EVERY = 1000  # log records between snapshots
+
+# Metadata lives in memory: the last snapshot plus the replayed mutation log
+_META = {"data": None, "log_records": 0, "version": 0}
+_META_LOCK = threading.Lock()
+# Sorted file paths, so prefix (directory) lookups are a bisect instead of a full scan
+PATH_INDEX = []
+# Directory tree: parent dir -> child dirs, plus a per-dir file count to know when to drop one
+DIR_INDEX = {}
+DIR_FILE_COUNTS = {}
+# Chunks are content-addressed and shared between files: chunk_id -> number of files
+# (and in-flight uploads, see pin_chunk) using it
+CHUNK_REFS = {}
+# Chunks each node is expected to hold: node_id -> {chunk_id: number of files using it}
+NODE_CHUNKS = {}
+
+# Nodes whose heartbeat digest disagrees with the metadata, waiting for repair
+REPAIR_QUEUE = queue.Queue()
+# Chunks a node should hold but no node has a copy of: node_id -> set of chunk IDs.
+# They are left out of the expected digest so they don't trigger a repair on every heartbeat
+LOST_CHUNKS = {}
+# Last (node digest, expected digest) pair seen per node, so an unchanged mismatch is only handled once
+_HEARTBEATS = {}
+
+def apply_record(metadata, record):
+    if record["op"] == "put":
+        metadata[record["path"]] = record["info"]
+    else:
+        metadata.pop(record["path"], None)
+
+# '/dfs/a/b.txt' -> [('/', '/dfs/'), ('/dfs/', '/dfs/a/')]
+def parent_dirs(file_path):
+    parts = file_path.split('/')[:-1]
+    return [('/'.join(parts[:i]) + '/', '/'.join(parts[:i + 1]) + '/') for i in range(1, len(parts))]
+
+def index_dirs(file_path, delta):
+    for parent, child in parent_dirs(file_path):
+        count = DIR_FILE_COUNTS.get(child, 0) + delta
+        if count > 0:
+            DIR_FILE_COUNTS[child] = count
+            DIR_INDEX.setdefault(parent, set()).add(child)
+        else:
+            DIR_FILE_COUNTS.pop(child, None)
+            children = DIR_INDEX.get(parent)
+            if children is not None:
+                children.discard(child)
+                if not children:
+                    del DIR_INDEX[parent]
+
+# Returns the chunks that are no longer referenced by any file
+def index_chunks(file_info, delta):
+    released = set()
+    for chunk_id in {chunk_id for replica in file_info["replicas"] for chunk_id in replica["chunk_ids"]}:
+        refs = CHUNK_REFS.get(chunk_id, 0) + delta
+        if refs > 0:
+            CHUNK_REFS[chunk_id] = refs
+        else:
+            CHUNK_REFS.pop(chunk_id, None)
+            released.add(chunk_id)
+    for replica in file_info["replicas"]:
+        node_chunks = NODE_CHUNKS.setdefault(replica["node_id"], {})
+        for chunk_id in set(replica["chunk_ids"]):
+            refs = node_chunks.get(chunk_id, 0) + delta
+            if refs > 0:
+                node_chunks[chunk_id] = refs
+            else:
+                node_chunks.pop(chunk_id, None)
+    return released
+
+def _load_locked():
+    if _META["data"] is None:
+        data = {}
+        if os.path.exists(METADATA_FILE):
+            with open(METADATA_FILE, 'rb') as f:
+                data = orjson.loads(f.read())
+        records = 0
+        if os.path.exists(METADATA_LOG):
+            with open(METADATA_LOG, 'r+b') as f:
+                end = 0  # end of the last complete record
+                for line in iter(f.readline, b''):
+                    try:
+                        if not line.endswith(b"\n"):
+                            raise ValueError("unterminated record")
+                        record = orjson.loads(line)
+                    except ValueError:
+                        # Torn write at the end of the log: cut it off, otherwise the
+                        # next append lands on the same line and is lost on replay
+                        f.truncate(end)
+                        break
+                    apply_record(data, record)
+                    records += 1
+                    end = f.tell()
+        _META["data"] = data
+        _META["log_records"] = records
+        _META["version"] += 1
+        PATH_INDEX[:] = sorted(data)
+        DIR_INDEX.clear()
+        DIR_FILE_COUNTS.clear()
+        CHUNK_REFS.clear()
+        NODE_CHUNKS.clear()
+        for path, file_info in data.items():
+            index_dirs(path, 1)
+            index_chunks(file_info, 1)
+    return _META["data"]
+
+# Chunks a delete is removing from the nodes: chunk_id -> deletes in flight.
+# Uploads wait for these rather than reuse a copy that is about to disappear
+DELETING_CHUNKS = {}
+_DELETES_DONE = threading.Condition(_META_LOCK)
+
+# Reference a chunk an upload is about to reuse, so no delete can remove it before
+# the file is recorded; waits out a delete of the same chunk that is already under way
+def pin_chunk(chunk_id):
+    with _DELETES_DONE:
+        _load_locked()
+        CHUNK_REFS[chunk_id] = CHUNK_REFS.get(chunk_id, 0) + 1
+        while chunk_id in DELETING_CHUNKS:
+            _DELETES_DONE.wait()
+
+def unpin_chunks(chunk_ids):
+    with _META_LOCK:
+        for chunk_id in chunk_ids:
+            refs = CHUNK_REFS.get(chunk_id, 0) - 1
+            if refs > 0:
+                CHUNK_REFS[chunk_id] = refs
+            else:
+                CHUNK_REFS.pop(chunk_id, None)
+
+# Of the chunks a delete released, claim the ones no upload has pinned since
+def claim_deletes(chunk_ids):
+    with _META_LOCK:
+        claimed = {chunk_id for chunk_id in chunk_ids if chunk_id not in CHUNK_REFS}
+        for chunk_id in claimed:
+            DELETING_CHUNKS[chunk_id] = DELETING_CHUNKS.get(chunk_id, 0) + 1
+        return claimed
+
+def finish_deletes(chunk_ids):
+    with _DELETES_DONE:
+        for chunk_id in chunk_ids:
+            count = DELETING_CHUNKS.pop(chunk_id, 1) - 1
+            if count > 0:
+                DELETING_CHUNKS[chunk_id] = count
+        _DELETES_DONE.notify_all()
+
 # Initialize or load metadata
 def load_metadata():
-    if os.path.exists(METADATA_FILE):
-        with open(METADATA_FILE, 'r') as f:
-            return json.load(f)
-    return {}
+    with _META_LOCK:
+        # Shallow copy, callers only read top-level entries
+        return dict(_load_locked())
 
+# Write a full snapshot and start a new log (called with _META_LOCK held)
 def save_metadata(metadata):
-    with open(METADATA_FILE, 'w') as f:
-        json.dump(metadata, f, indent=2)
+    tmp_file = METADATA_FILE + ".tmp"
+    with open(tmp_file, 'wb') as f:
+        f.write(orjson.dumps(metadata, option=orjson.OPT_INDENT_2))
+        f.flush()
+        os.fsync(f.fileno())
+    # Readers never see a partially written snapshot, even after a crash
+    os.replace(tmp_file, METADATA_FILE)
+    open(METADATA_LOG, 'w').close()
+
+# Append one mutation to the log; O(1) instead of rewriting every file entry
+def log_metadata(record):
+    with _META_LOCK:
+        metadata = _load_locked()
+        with open(METADATA_LOG, 'ab') as f:
+            f.write(orjson.dumps(record) + b"\n")
+        old_info = metadata.get(record["path"])
+        apply_record(metadata, record)
+        new_info = metadata.get(record["path"])
+        if old_info is None and new_info is not None:
+            bisect.insort(PATH_INDEX, record["path"])
+            index_dirs(record["path"], 1)
+        elif old_info is not None and new_info is None:
+            del PATH_INDEX[bisect.bisect_left(PATH_INDEX, record["path"])]
+            index_dirs(record["path"], -1)
+        # Count the new references first so chunks kept by an overwrite aren't released
+        released = set()
+        if new_info is not None:
+            index_chunks(new_info, 1)
+        if old_info is not None:
+            released = index_chunks(old_info, -1)
+        _META["log_records"] += 1
+        _META["version"] += 1
+        if _META["log_records"] >= COMPACT_EVERY:
+            save_metadata(metadata)
+            _META["log_records"] = 0
+        return released
+
+# Bumped on every mutation, so caches keyed on it never serve stale metadata
+def metadata_version():
+    with _META_LOCK:
+        _load_locked()
+        return _META["version"]
 
-# Asynchronous function for uploading chunks
+def files_with_prefix(prefix):
+    with _META_LOCK:
+        metadata = _load_locked()
+        lo = bisect.bisect_left(PATH_INDEX, prefix)
+        hi = bisect.bisect_left(PATH_INDEX, prefix + '\U0010ffff')
+        return {path: metadata[path] for path in PATH_INDEX[lo:hi]}
+
+def subdirectories(directory):
+    if not directory.endswith('/'):
+        directory += '/'
+    with _META_LOCK:
+        _load_locked()
+        return sorted(DIR_INDEX.get(directory, ()))
+
+def expected_chunks(node_id):
+    with _META_LOCK:
+        _load_locked()
+        return set(NODE_CHUNKS.get(node_id, ()))
+
+# Same digest the nodes send in their heartbeats
+def chunk_set_digest(chunk_ids):
+    return hashlib.sha256("\n".join(sorted(chunk_ids)).encode()).hexdigest()
+
+def put_file(file_path, file_info):
+    return log_metadata({"op": "put", "path": file_path, "info": file_info})
+
+def remove_file(file_path):
+    return log_metadata({"op": "delete", "path": file_path})
+
+# Hash the whole chunk in one call: both hashlib (SHA-NI via OpenSSL) and blake3
+# (SIMD) release the GIL for large buffers
+def chunk_hash(chunk_data):
+    if blake3 is not None:
+        return blake3(chunk_data).hexdigest()
+    return hashlib.sha256(chunk_data).hexdigest()
+
+# Asynchronous function for uploading chunks, skipped if the node already holds
+# the chunk (chunk IDs are content hashes); uploads pin the chunk first, so a copy
+# being reused can't be deleted underneath them
 def async_upload_chunk(node_url, chunk_data, chunk_id):
     try:
-        response = requests.post(
+        if SESSION.head(f"{node_url}/chunk/{chunk_id}").status_code == 200:
+            return
+        response = SESSION.post(
             f"{node_url}/chunk",
             data=chunk_data,
-            headers={"X-Chunk-ID": chunk_id}
+            headers={"X-Chunk-ID": chunk_id, HASH_HEADER: chunk_id}
         )
+        response.raise_for_status()
     except Exception as e:
         print(f"Error uploading chunk {chunk_id} to {node_url}: {str(e)}")
+        raise
+
+# Open a streamed chunk response, falling back to the backup replica
+def open_chunk(file_info, node_id, chunk_id):
+    response = SESSION.get(f"{NODE_MAP[node_id]}/chunk/{chunk_id}", stream=True)
+    if response.status_code != 200 and len(file_info["replicas"]) > 1:
+        response.close()
+        backup_node = file_info["replicas"][1]["node_id"]
+        response = SESSION.get(f"{NODE_MAP[backup_node]}/chunk/{chunk_id}", stream=True)
+    if response.status_code != 200:
+        response.close()
+        raise IOError(f"Failed to retrieve chunk {chunk_id}")
+    return response
 
-# Background reconciliation function
+# Repair a missing chunk replica from any node that holds a copy. Returns True once
+# repaired, False if a source couldn't be reached, and None if no source has the
+# chunk at all (it is lost and retrying won't bring it back)
+def repair_chunk(node_id, chunk_id, source_ids):
+    print(f"Chunk {chunk_id} missing on {node_id}, initiating repair")
+    reachable = True
+    for source_id in source_ids:
+        try:
+            backup_response = SESSION.get(f"{NODE_MAP[source_id]}/chunk/{chunk_id}")
+            if backup_response.status_code == 200:
+                async_upload_chunk(NODE_MAP[node_id], backup_response.content, chunk_id)
+                return True
+            if backup_response.status_code != 404:
+                reachable = False
+        except Exception as e:
+            print(f"Error repairing chunk {chunk_id} from {source_id}: {str(e)}")
+            reachable = False
+    return False if not reachable else None
+
+# Diff a node's chunk list against the metadata and copy back whatever is missing
+def repair_node(node_id):
+    response = SESSION.get(f"{NODE_MAP[node_id]}/chunks")
+    response.raise_for_status()
+    missing = expected_chunks(node_id) - set(response.json())
+    # Chunks already known to be lost stay lost until the node holds them again
+    lost = LOST_CHUNKS.get(node_id, set()) & missing
+    missing -= lost
+    with _META_LOCK:
+        sources = {chunk_id: [other for other, chunks in NODE_CHUNKS.items() if other != node_id and chunk_id in chunks]
+                   for chunk_id in missing}
+    futures = {chunk_id: POOL.submit(repair_chunk, node_id, chunk_id, sources[chunk_id]) for chunk_id in missing}
+    results = {chunk_id: future.result() for chunk_id, future in futures.items()}
+    for chunk_id, result in results.items():
+        if result is None:
+            print(f"Chunk {chunk_id} has no surviving copy, giving up on it for {node_id}")
+            lost.add(chunk_id)
+    LOST_CHUNKS[node_id] = lost
+    return all(result is not False for result in results.values())
+
+# Background reconciliation: only nodes reported out of sync by a heartbeat are checked
 def reconcile_chunks():
     while True:
-        metadata = load_metadata()
-        for file_path, file_info in metadata.items():
-            for replica in file_info["replicas"]:
-                node_id = replica["node_id"]
-                chunk_ids = replica["chunk_ids"]
-                for chunk_id in chunk_ids:
-                    try:
-                        # Verify chunk exists
-                        response = requests.get(f"{NODE_MAP[node_id]}/chunk/{chunk_id}")
-                        if response.status_code != 200:
-                            print(f"Chunk {chunk_id} missing on {node_id}, initiating repair")
-                            # Repair logic (simplified example)
-                            backup_node_id = file_info["replicas"][1]["node_id"]
-                            backup_response = requests.get(f"{NODE_MAP[backup_node_id]}/chunk/{chunk_id}")
-                            if backup_response.status_code == 200:
-                                async_upload_chunk(NODE_MAP[node_id], backup_response.content, chunk_id)
-                    except Exception as e:
-                        print(f"Error during reconciliation: {str(e)}")
-        time.sleep(60)  # Run reconciliation every 60 seconds
+        node_id = REPAIR_QUEUE.get()
+        try:
+            repaired = repair_node(node_id)
+        except Exception as e:
+            print(f"Error during reconciliation: {str(e)}")
+            repaired = False
+        if not repaired:
+            # Check again on the next heartbeat
+            _HEARTBEATS.pop(node_id, None)
+        REPAIR_QUEUE.task_done()
+
+# Timestamp for metadata written by this request, formatted once per request
+def request_timestamp():
+    if "now_iso" not in g:
+        g.now_iso = datetime.now().isoformat()
+    return g.now_iso
 
 # Web interface routes
 @app.route('/')
@@ -88,18 +394,14 @@ def index():
 @app.route('/browse')
 def browse():
     directory = request.args.get('dir', '/')
-    metadata = load_metadata()
     
-    files = {path: info for path, info in metadata.items() if path.startswith(directory)}
-    directories = set()
-    for path in files.keys():
-        parts = path.split('/')
-        if len(parts) > 2:
-            parent_dir = '/'.join(parts[:-1]) + '/'
-            if parent_dir.startswith(directory) and parent_dir != directory:
-                directories.add(parent_dir)
+    # Only files directly in this directory; nested ones are reached through subdirectories
+    parent = directory if directory.endswith('/') else directory + '/'
+    files = {path: info for path, info in files_with_prefix(directory).items()
+             if path.rsplit('/', 1)[0] + '/' == parent}
+    directories = subdirectories(directory)
     
-    return render_template('browse.html', files=files, directories=sorted(directories), current_dir=directory)
+    return render_template('browse.html', files=files, directories=directories, current_dir=directory)
 
 @app.route('/upload', methods=['GET', 'POST'])
 def upload_file():
@@ -116,30 +418,50 @@ def upload_file():
             return redirect(request.url)
             
         if file:
-            file_data = file.read()
-            file_size = len(file_data)
             file_path = os.path.join(directory, file.filename)
             
+            file_size = 0
             chunks = []
-            for i in range(0, file_size, CHUNK_SIZE):
-                chunk_data = file_data[i:i+CHUNK_SIZE]
-                chunk_id = str(uuid.uuid4())
-                chunks.append(chunk_id)
+            futures = []
+            # Chunks this upload reuses or stores, referenced until the file is recorded
+            pinned = []
+            try:
+                while True:
+                    # Fresh buffer per chunk: the upload threads keep a view of it
+                    buf = bytearray(CHUNK_SIZE)
+                    n = file.stream.readinto(buf)
+                    if not n:
+                        break
+                    chunk_data = memoryview(buf)[:n]
+                    file_size += n
+                    # Content-addressed chunk IDs: identical chunks are stored once
+                    chunk_id = chunk_hash(chunk_data)
+                    chunks.append(chunk_id)
+                    pin_chunk(chunk_id)
+                    pinned.append(chunk_id)
                 
-                # Asynchronous upload to nodes (2 replicas)
-                for node_id in ["node1", "node2"]:
-                    threading.Thread(target=async_upload_chunk, args=(NODE_MAP[node_id], chunk_data, chunk_id)).start()
+                    # Asynchronous upload to nodes (2 replicas)
+                    for node_id in ["node1", "node2"]:
+                        futures.append(POOL.submit(async_upload_chunk, NODE_MAP[node_id], chunk_data, chunk_id))
             
-            metadata = load_metadata()
-            metadata[file_path] = {
-                "size": file_size,
-                "created_at": datetime.now().isoformat(),
-                "replicas": [
-                    {"node_id": "node1", "chunk_ids": chunks},
-                    {"node_id": "node2", "chunk_ids": chunks}
-                ]
-            }
-            save_metadata(metadata)
+                # Only record the file once every replica is stored
+                for future in as_completed(futures):
+                    try:
+                        future.result()
+                    except Exception as e:
+                        flash(f"Error uploading file: {str(e)}")
+                        return redirect(request.url)
+            
+                put_file(file_path, {
+                    "size": file_size,
+                    "created_at": request_timestamp(),
+                    "replicas": [
+                        {"node_id": "node1", "chunk_ids": chunks},
+                        {"node_id": "node2", "chunk_ids": chunks}
+                    ]
+                })
+            finally:
+                unpin_chunks(pinned)
             
             flash(f"File {file.filename} uploaded successfully")
             return redirect(url_for('browse', dir=directory))
@@ -162,35 +484,28 @@ def download_file(file_path):
     node_id = replica["node_id"]
     chunk_ids = replica["chunk_ids"]
     
-    file_data = bytearray()
-    for chunk_id in chunk_ids:
-        try:
-            response = requests.get(f"{NODE_MAP[node_id]}/chunk/{chunk_id}")
-            if response.status_code == 200:
-                file_data.extend(response.content)
-            else:
-                if len(file_info["replicas"]) > 1:
-                    backup_replica = file_info["replicas"][1]
-                    backup_node = backup_replica["node_id"]
-                    backup_response = requests.get(f"{NODE_MAP[backup_node]}/chunk/{chunk_id}")
-                    if backup_response.status_code == 200:
-                        file_data.extend(backup_response.content)
-                    else:
-                        flash(f"Failed to retrieve chunk {chunk_id}")
-                        return redirect(url_for('browse'))
-                else:
-                    flash(f"Failed to retrieve chunk {chunk_id}")
-                    return redirect(url_for('browse'))
-        except Exception as e:
-            flash(f"Error downloading chunk: {str(e)}")
-            return redirect(url_for('browse'))
+    # Open the first chunk up front so a missing file can still be reported
+    try:
+        first_response = open_chunk(file_info, node_id, chunk_ids[0]) if chunk_ids else None
+    except Exception as e:
+        flash(f"Error downloading chunk: {str(e)}")
+        return redirect(url_for('browse'))
+    
+    # Stream chunks to the client in order instead of buffering the whole file
+    def generate():
+        for i, chunk_id in enumerate(chunk_ids):
+            response = first_response if i == 0 else open_chunk(file_info, node_id, chunk_id)
+            with response:
+                yield from response.iter_content(STREAM_BLOCK_SIZE)
     
     filename = os.path.basename(file_path)
-    return send_file(
-        io.BytesIO(file_data),
-        as_attachment=True,
-        download_name=filename,
-        mimetype='application/octet-stream'
+    return Response(
+        stream_with_context(generate()),
+        mimetype='application/octet-stream',
+        headers={
+            "Content-Disposition": f'attachment; filename="{filename}"',
+            "Content-Length": str(file_info["size"])
+        }
     )
 
 @app.route('/delete/<path:file_path>', methods=['POST'])
@@ -204,10 +519,15 @@ def delete_file_web(file_path):
         flash("File not found")
         return redirect(url_for('browse'))
     
+    # Remove the file first; only chunks no other file references are deleted,
+    # and none an upload has pinned for reuse in the meantime
+    released = claim_deletes(remove_file(file_path))
     chunks_to_delete = []
     for replica in metadata[file_path]["replicas"]:
         node_id = replica["node_id"]
         for chunk_id in replica["chunk_ids"]:
+            if chunk_id not in released:
+                continue
             chunks_to_delete.append({
                 "node_id": node_id,
                 "chunk_id": chunk_id
@@ -215,12 +535,10 @@ def delete_file_web(file_path):
     
     for chunk_info in chunks_to_delete:
         try:
-            requests.delete(f"{NODE_MAP[chunk_info['node_id']]}/chunk/{chunk_info['chunk_id']}")
+            SESSION.delete(f"{NODE_MAP[chunk_info['node_id']]}/chunk/{chunk_info['chunk_id']}")
         except Exception as e:
             flash(f"Error deleting chunk: {str(e)}")
-    
-    del metadata[file_path]
-    save_metadata(metadata)
+    finish_deletes(released)
     
     flash(f"File {os.path.basename(file_path)} deleted successfully")
     return redirect(url_for('browse'))
@@ -232,8 +550,7 @@ def create_file():
     file_path = file_data['path']
     file_size = file_data['size']
     
-    metadata = load_metadata()
-    chunk_count = (file_size + CHUNK_SIZE - 1)
+    chunk_count = (file_size + CHUNK_SIZE - 1) // CHUNK_SIZE
     chunks = [str(uuid.uuid4()) for _ in range(chunk_count)]
     
     available_nodes = ["node1", "node2", "node3"]
@@ -246,12 +563,11 @@ def create_file():
             "chunk_ids": chunks
         })
     
-    metadata[file_path] = {
+    put_file(file_path, {
         "size": file_size,
-        "created_at": datetime.now().isoformat(),
+        "created_at": request_timestamp(),
         "replicas": replicas
-    }
-    save_metadata(metadata)
+    })
     
     return jsonify({
         "path": file_path,
@@ -272,13 +588,15 @@ def get_file_metadata():
         "metadata": metadata[file_path]
     })
 
+# Encoded listings, reused until the metadata version changes
+@functools.lru_cache(maxsize=256)
+def serialize_file_list(directory, version):
+    return orjson.dumps(files_with_prefix(directory))
+
 @app.route('/api/list', methods=['GET'])
 def list_files():
     directory = request.args.get('directory', '/')
-    metadata = load_metadata()
-    
-    files = {path: info for path, info in metadata.items() if path.startswith(directory)}
-    return jsonify(files)
+    return Response(serialize_file_list(directory, metadata_version()), mimetype='application/json')
 
 @app.route('/api/file', methods=['DELETE'])
 def delete_file():
@@ -288,37 +606,57 @@ def delete_file():
     if file_path not in metadata:
         return jsonify({"error": "File not found"}), 404
     
+    # Remove the file first; only chunks no other file references are deleted
+    released = remove_file(file_path)
     chunks_to_delete = []
     for replica in metadata[file_path]["replicas"]:
         node_id = replica["node_id"]
         for chunk_id in replica["chunk_ids"]:
+            if chunk_id not in released:
+                continue
             chunks_to_delete.append({
                 "node_id": node_id,
                 "chunk_id": chunk_id
             })
     
-    del metadata[file_path]
-    save_metadata(metadata)
-    
     return jsonify({
         "deleted": file_path,
         "chunks_to_delete": chunks_to_delete
     })
 
-# Templates for the web interface
+# Nodes report a digest of the chunks they hold every few seconds
+@app.route('/heartbeat', methods=['POST'])
+def heartbeat():
+    data = request.json
+    node_id = data['node_id']
+    if node_id not in NODE_MAP:
+        return jsonify({"error": "Unknown node"}), 404
+    
+    expected_digest = chunk_set_digest(expected_chunks(node_id) - LOST_CHUNKS.get(node_id, set()))
+    in_sync = data['digest'] == expected_digest
+    state = (data['digest'], expected_digest)
+    if not in_sync and _HEARTBEATS.get(node_id) != state:
+        REPAIR_QUEUE.put(node_id)
+    _HEARTBEATS[node_id] = state
+    
+    return jsonify({"in_sync": in_sync})
+
+# Templates for the web interface, encoded once since they never change at runtime
+TEMPLATE_BYTES = {name: content.encode() for name, content in templates.items()}
+TEMPLATE_LIST_BYTES = orjson.dumps({"available_templates": list(templates.keys())})
+
 @app.route('/templates')
 def get_templates():    
     template_name = request.args.get('name')
-    if template_name in templates:
-        return templates[template_name]
-    return jsonify({"available_templates": list(templates.keys())})
+    if template_name in TEMPLATE_BYTES:
+        return Response(TEMPLATE_BYTES[template_name], mimetype='text/html')
+    return Response(TEMPLATE_LIST_BYTES, mimetype='application/json')
 
 if __name__ == '__main__':
-    ports = [5001, 5002, 5003]
     processes = []
 
-    for port in ports:
-        process = run_node(port)
+    for node_id, node_url in NODE_MAP.items():
+        process = run_node(int(node_url.rsplit(':', 1)[1]), node_id)
         if process:
             processes.append(process)
 
@@ -328,9 +666,17 @@ if __name__ == '__main__':
     if not os.path.exists('templates'):
         os.makedirs('templates')
         
-    for template_name, template_content in templates.items():
+    # Only rewrite templates whose content changed
+    for template_name, template_bytes in TEMPLATE_BYTES.items():
         if template_name.endswith('.html'):
-            with open(os.path.join('templates', template_name), 'w') as f:
-                f.write(template_content)
+            template_path = os.path.join('templates', template_name)
+            try:
+                with open(template_path, 'rb') as f:
+                    current = f.read()
+            except FileNotFoundError:
+                current = None
+            if current != template_bytes:
+                with open(template_path, 'wb') as f:
+                    f.write(template_bytes)
     
     app.run(host='0.0.0.0', port=5000, debug=True)
\ No newline at end of file
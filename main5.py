@@ -1,50 +1,89 @@
-from flask import Flask, request, jsonify, render_template, redirect, url_for, flash, send_file
+from flask import Flask, request, jsonify, render_template, redirect, url_for, flash, Response, stream_with_context
+from flask.json.provider import DefaultJSONProvider
 from flask_login import LoginManager, UserMixin, login_user, logout_user, login_required, current_user
-import uuid
-import json
+from jinja2 import ChoiceLoader, DictLoader
+import orjson
+import tempfile
 import os
 import hashlib
+import hmac
+import random
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from datetime import datetime
-import io
+from collections import deque
 import subprocess
 import threading
 import time
+import sched
 import signal
+import queue
 import logging
 import atexit
+from templates import templates
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+from concurrent.futures import ThreadPoolExecutor, wait, as_completed, FIRST_COMPLETED
 
 atexit.register(lambda: terminate_subprocesses(None, None))
 
 # Set up logging
 logging.basicConfig(filename='main5.log', level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
 
+# Check that a PID from a PID file is still our node on this port, not a recycled PID
+def is_node_process(pid, port):
+    if psutil is not None:
+        try:
+            cmdline = psutil.Process(pid).cmdline()
+        except psutil.Error:
+            return False
+    else:
+        try:
+            os.kill(pid, 0)  # Check if the process with this PID is running
+        except OSError:
+            return False
+        try:
+            with open(f"/proc/{pid}/cmdline", 'rb') as f:
+                cmdline = f.read().decode(errors='replace').split('\0')
+        except OSError:
+            return True  # no /proc to check against, trust the PID
+    return any(arg.endswith("node.py") for arg in cmdline) and str(port) in cmdline
+
 # Function to run node.py with a specific port.
 def run_node(port):
     pid_file = f"node_{port}.pid"
-    if os.path.exists(pid_file):
+    try:
         with open(pid_file, 'r') as f:
-            pid = int(f.read().strip())
-            try:
-                os.kill(pid, 0)  # Check if the process with this PID is running
-            except OSError:
-                # Process does not exist, remove stale pid file
-                try:
-                    os.remove(pid_file)
-                    logging.info(f"Removed stale PID file for port {port}")
-                except Exception as e:
-                    logging.error(f"Error removing stale PID file for port {port}: {e}")
-                    return None
-            except Exception as e:
-                logging.error(f"Error checking process for port {port}: {e}")
-                return None
-            else:
-                # Process exists, do not start a new one
-                logging.info(f"Node already running on port {port} with PID {pid}")
-                return None
+            pid = int(f.read())
+    except FileNotFoundError:
+        pid = None
+    except (OSError, ValueError) as e:
+        # Overwritten below when the node starts
+        logging.error(f"Unreadable PID file for port {port}: {e}")
+        pid = None
+    if pid is not None:
+        if is_node_process(pid, port):
+            # Process exists, do not start a new one
+            logging.info(f"Node already running on port {port} with PID {pid}")
+            return None
+        # Process does not exist (or the PID was reused), remove stale pid file
+        try:
+            os.remove(pid_file)
+            logging.info(f"Removed stale PID file for port {port}")
+        except Exception as e:
+            logging.error(f"Error removing stale PID file for port {port}: {e}")
+            return None
     try:
         command = ["python", "node.py", "-p", str(port)]  # Use 'python' instead of 'python3' on Windows
-        process = subprocess.Popen(command)
+        # Each node leads its own process group so shutdown can signal it as a whole
+        if os.name == 'nt':
+            process = subprocess.Popen(command, creationflags=subprocess.CREATE_NEW_PROCESS_GROUP)
+        else:
+            process = subprocess.Popen(command, start_new_session=True)
         with open(pid_file, 'w') as f:
             f.write(str(process.pid))
         logging.info(f"Started node.py on port {port} with PID {process.pid}")
@@ -53,18 +92,44 @@ def run_node(port):
         logging.error(f"Error starting node.py on port {port}: {e}")
         return None
 
+SHUTDOWN_GRACE = 2  # seconds nodes get to exit before being killed
+
+# Stop a node's whole process group (kill=True skips the graceful SIGTERM);
+# Windows has no killpg, so fall back to terminate/kill there
+def signal_node(process, kill=False):
+    try:
+        if os.name == 'nt':
+            if kill:
+                process.kill()
+            else:
+                process.terminate()
+        else:
+            os.killpg(process.pid, signal.SIGKILL if kill else signal.SIGTERM)
+    except ProcessLookupError:
+        pass  # already exited
+    except Exception as e:
+        logging.error(f"Error terminating process {process.pid}: {e}")
+
 # Function to terminate subprocesses
 def terminate_subprocesses(signum, frame):
+    flush_metadata()
+    users.flush()
+    UPLOAD_POOL.shutdown(wait=False)
+    DOWNLOAD_POOL.shutdown(wait=False)
+    RECONCILE_POOL.shutdown(wait=False)
+    HEALTH_POOL.shutdown(wait=False)
+    DELETE_POOL.shutdown(wait=False)
     logging.info("Terminating subprocesses...")
-    for process in processes:
-        if process is None: continue
-        try:
-            process.terminate()
-            process.wait(timeout=5)
-        except subprocess.TimeoutExpired:
-            process.kill()
-        except Exception as e:
-            logging.error(f"Error terminating process {process.pid}: {e}")
+    # Signal every node first, then give them one shared grace period
+    running = [process for process in processes if process is not None]
+    for process in running:
+        signal_node(process)
+    deadline = time.monotonic() + SHUTDOWN_GRACE
+    while time.monotonic() < deadline and any(process.poll() is None for process in running):
+        time.sleep(0.1)
+    for process in running:
+        if process.poll() is None:
+            signal_node(process, kill=True)
    # Remove the PID file on exit
     for port in ports:
         pid_file = f"node_{port}.pid"
@@ -78,8 +143,22 @@ def terminate_subprocesses(signum, frame):
     logging.info("All subprocesses terminated.")
     os._exit(0)
 
+# Serve jsonify() through orjson
+class OrjsonProvider(DefaultJSONProvider):
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, default=self.default).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
 app = Flask(__name__)
 app.secret_key = os.environ.get('SECRET_KEY', 'development-key')
+app.json = OrjsonProvider(app)
+# Serve the embedded templates from memory (falling back to the templates folder),
+# compile each one once and never re-check it for changes
+app.jinja_loader = ChoiceLoader([DictLoader(templates), app.jinja_loader])
+app.jinja_options = {**app.jinja_options, "cache_size": -1}
+app.config['TEMPLATES_AUTO_RELOAD'] = False
 
 # Configuration
 METADATA_FILE = 'metadata.json'
@@ -90,23 +169,127 @@ NODE_MAP = {
     "node3": "http://localhost:5003"
 }
 
+# Shared keep-alive connection pool for node requests; no retries, callers handle failures
+SESSION = requests.Session()
+SESSION.mount("http://", HTTPAdapter(pool_connections=8, pool_maxsize=64))
+# Same pooling plus a short retry, only for writes that are safe to repeat (chunk uploads, batched deletes)
+RETRY_SESSION = requests.Session()
+RETRY_SESSION.mount("http://", HTTPAdapter(pool_connections=8, pool_maxsize=64, max_retries=Retry(total=2, backoff_factor=0.2)))
+# Health probes never retry, so a hung node costs one timeout and is reported as unresponsive
+HEALTH_SESSION = requests.Session()
+HEALTH_SESSION.mount("http://", HTTPAdapter(pool_connections=len(NODE_MAP), pool_maxsize=len(NODE_MAP), max_retries=0))
+
+# Reused worker threads for replica uploads, bounding concurrent requests to the nodes
+UPLOAD_POOL = ThreadPoolExecutor(max_workers=16, thread_name_prefix="chunk-up")
+MAX_PENDING_UPLOADS = 16  # chunks held in memory while waiting for a worker
+# Reusable chunk-sized upload buffers, so concurrent uploads don't allocate 4MB per chunk
+CHUNK_POOL = queue.Queue(maxsize=32)
+
+def get_buf():
+    try:
+        return CHUNK_POOL.get_nowait()
+    except queue.Empty:
+        return bytearray(CHUNK_SIZE)
+
+def put_buf(buf):
+    try:
+        CHUNK_POOL.put_nowait(buf)
+    except queue.Full:
+        pass  # pool is full, let this one be garbage collected
+
+# Separate pool so downloads don't queue behind uploads
+DOWNLOAD_POOL = ThreadPoolExecutor(max_workers=8, thread_name_prefix="chunk-down")
+DOWNLOAD_AHEAD = 8  # chunks fetched ahead of the one being streamed to the client
+# Small pool so reconciliation fans out across nodes but can't starve user traffic
+RECONCILE_POOL = ThreadPoolExecutor(max_workers=4, thread_name_prefix="reconcile")
+RECONCILE_INTERVAL = 60  # seconds between reconciliation runs
+# Soft cap on chunk checks per run, so a large FS doesn't stall a run. It is checked
+# between files: a file is always checked whole, so one run can exceed it by one file's chunks
+RECONCILE_MAX_CHUNKS = 1000
+RECONCILE_FRESHNESS = 3600  # seconds before a checked file is checked again
+# When each file's chunks were last verified; kept in memory so reconciliation
+# doesn't rewrite metadata.json every run
+_last_checked = {}
+HEALTH_POOL = ThreadPoolExecutor(max_workers=len(NODE_MAP), thread_name_prefix="health")
+DELETE_POOL = ThreadPoolExecutor(max_workers=len(NODE_MAP), thread_name_prefix="chunk-del")
+DELETE_TIMEOUT = 5  # seconds to wait for nodes before answering a delete
+
 login_manager = LoginManager()
 login_manager.init_app(app)
 login_manager.login_view = 'login'
 
 USERS_FILE = 'users.json'
 
-def load_users():
-    if os.path.exists(USERS_FILE):
-        with open(USERS_FILE, 'r') as f:
-            return json.load(f)
-    return {}
-
-def save_users(users):
-    with open(USERS_FILE, 'w') as f:
-        json.dump(users, f, indent=2)
-
-users = load_users()
+USERS_FLUSH_INTERVAL = 0.5  # seconds to collect registrations before writing the file
+
+# Users kept in memory; changes are written to users.json in batches by a background thread
+class UserStore:
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.dirty = False
+        self._changed = threading.Event()
+        self.users = {}
+        if os.path.exists(path):
+            with open(path, 'rb') as f:
+                self.users = orjson.loads(f.read())
+        threading.Thread(target=self._flusher, daemon=True, name="users-flush").start()
+
+    def __contains__(self, username):
+        return username in self.users
+
+    def get(self, username):
+        return self.users.get(username)
+
+    def add(self, username, record):
+        with self.lock:
+            self.users[username] = record
+            self.dirty = True
+        self._changed.set()
+
+    def flush(self):
+        with self.lock:
+            if not self.dirty:
+                return
+            tmp_file = None
+            try:
+                fd, tmp_file = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(self.path)), prefix='users-', suffix='.json')
+                with os.fdopen(fd, 'wb') as f:
+                    f.write(orjson.dumps(self.users, option=orjson.OPT_INDENT_2))
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(tmp_file, self.path)
+                self.dirty = False
+            except Exception as e:
+                logging.error(f"Error saving users: {e}")
+                if tmp_file and os.path.exists(tmp_file):
+                    os.remove(tmp_file)
+
+    def _flusher(self):
+        while True:
+            self._changed.wait()
+            time.sleep(USERS_FLUSH_INTERVAL)
+            self._changed.clear()
+            self.flush()
+            if self.dirty:
+                self._changed.set()  # write failed, try again
+
+users = UserStore(USERS_FILE)
+
+# Salted scrypt verifier; n/r/p are stored with the hash so they can be raised later
+SCRYPT_PARAMS = {"n": 2 ** 14, "r": 8, "p": 1}
+
+def hash_password(password, salt=None, n=SCRYPT_PARAMS["n"], r=SCRYPT_PARAMS["r"], p=SCRYPT_PARAMS["p"]):
+    salt = salt or os.urandom(16)
+    derived = hashlib.scrypt(password.encode(), salt=salt, n=n, r=r, p=p, dklen=32)
+    return {"salt": salt.hex(), "hash": derived.hex(), "n": n, "r": r, "p": p}
+
+def verify_password(user, password):
+    if "hash" in user:
+        derived = hashlib.scrypt(password.encode(), salt=bytes.fromhex(user["salt"]), n=user["n"], r=user["r"], p=user["p"], dklen=32)
+        return hmac.compare_digest(derived, bytes.fromhex(user["hash"]))
+    # Accounts registered before salted hashes were introduced
+    return hmac.compare_digest(hashlib.sha256(password.encode()).digest(), bytes.fromhex(user["password"]))
 
 class User(UserMixin):
     def __init__(self, username):
@@ -118,56 +301,309 @@ def load_user(user_id):
         return User(user_id)
     return None
 
-# Initialize or load metadata
-def load_metadata():
-    if os.path.exists(METADATA_FILE):
+# In-memory copy of metadata.json, re-read only when the file's mtime changes.
+# Saves update it right away and are written to disk in batches by metadata_flusher.
+_metadata_cache = {"data": None, "mtime": 0, "dirty": False}
+_metadata_lock = threading.RLock()
+_metadata_dirty = threading.Event()
+# Serializes writers, so an older snapshot can never replace a newer one on disk
+_metadata_flush_lock = threading.Lock()
+METADATA_FLUSH_INTERVAL = 1.0  # seconds to collect saves before writing the file
+# Directory index over the cached metadata: directory -> file paths anywhere below it,
+# directory -> file paths directly in it, and directory -> {parent directory of
+# those files: file count}
+_dir_files = {}
+_dir_children = {}
+_dir_subdirs = {}
+
+# '/dfs/a/b.txt' -> ['/', '/dfs/', '/dfs/a/']
+def dir_prefixes(path):
+    parts = path.split('/')
+    return ['/'.join(parts[:i]) + '/' for i in range(1, len(parts))]
+
+def index_path(path, delta):
+    parts = path.split('/')
+    parent_dir = '/'.join(parts[:-1]) + '/' if len(parts) > 2 else None
+    prefixes = dir_prefixes(path)
+    for prefix in prefixes:
+        indexes = (_dir_files, _dir_children) if prefix == prefixes[-1] else (_dir_files,)
+        for index in indexes:
+            files = index.setdefault(prefix, set())
+            if delta > 0:
+                files.add(path)
+            else:
+                files.discard(path)
+                if not files:
+                    del index[prefix]
+        if parent_dir and parent_dir != prefix:
+            counts = _dir_subdirs.setdefault(prefix, {})
+            counts[parent_dir] = counts.get(parent_dir, 0) + delta
+            if counts[parent_dir] <= 0:
+                del counts[parent_dir]
+                if not counts:
+                    del _dir_subdirs[prefix]
+
+def rebuild_dir_index(metadata):
+    _dir_files.clear()
+    _dir_children.clear()
+    _dir_subdirs.clear()
+    for path in metadata:
+        index_path(path, 1)
+
+# Cached metadata dict, reloaded if the file changed (call with _metadata_lock held)
+def cached_metadata():
+    if _metadata_cache["dirty"]:
+        return _metadata_cache["data"]  # unflushed saves are newer than the file
+    try:
+        mtime = os.stat(METADATA_FILE).st_mtime_ns
+    except FileNotFoundError:
+        if _metadata_cache["data"]:
+            rebuild_dir_index({})
+        _metadata_cache["data"] = {}
+        _metadata_cache["mtime"] = 0
+        return _metadata_cache["data"]
+    if _metadata_cache["data"] is None or mtime != _metadata_cache["mtime"]:
         try:
-            with open(METADATA_FILE, 'r') as f:
-                return json.load(f)
+            with open(METADATA_FILE, 'rb') as f:
+                data = orjson.loads(f.read())
         except Exception as e:
             logging.error(f"Error loading metadata: {e}")
-    return {}
+            return {}
+        _metadata_cache["data"] = data
+        _metadata_cache["mtime"] = mtime
+        rebuild_dir_index(data)
+    return _metadata_cache["data"]
+
+# Initialize or load metadata
+def load_metadata():
+    with _metadata_lock:
+        # Shallow copy, callers add and remove top-level entries before saving
+        return dict(cached_metadata())
 
 def save_metadata(metadata):
-    try:
-        with open(METADATA_FILE, 'w') as f:
-            json.dump(metadata, f, indent=2)
-    except Exception as e:
-        logging.error(f"Error saving metadata: {e}")
+    with _metadata_lock:
+        old_paths = cached_metadata().keys()
+        for path in old_paths - metadata.keys():
+            index_path(path, -1)
+        for path in metadata.keys() - old_paths:
+            index_path(path, 1)
+        _metadata_cache["data"] = dict(metadata)
+        _metadata_cache["dirty"] = True
+    _metadata_dirty.set()
+
+# Write the cached metadata to disk; a temp file plus os.replace means a crash
+# never leaves a half-written metadata.json. Only taking the snapshot holds
+# _metadata_lock, so requests don't wait on the write and fsync
+def flush_metadata():
+    with _metadata_flush_lock:
+        with _metadata_lock:
+            if not _metadata_cache["dirty"]:
+                return
+            # Saves replace the dict rather than mutating it, so this reference stays stable
+            data = _metadata_cache["data"]
+            _metadata_cache["dirty"] = False
+        tmp_file = None
+        try:
+            fd, tmp_file = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(METADATA_FILE)), prefix='meta-', suffix='.json')
+            with os.fdopen(fd, 'wb') as f:
+                f.write(orjson.dumps(data, option=orjson.OPT_INDENT_2))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_file, METADATA_FILE)
+            with _metadata_lock:
+                _metadata_cache["mtime"] = os.stat(METADATA_FILE).st_mtime_ns
+        except Exception as e:
+            logging.error(f"Error saving metadata: {e}")
+            if tmp_file and os.path.exists(tmp_file):
+                os.remove(tmp_file)
+            with _metadata_lock:
+                _metadata_cache["dirty"] = True
 
-# Asynchronous function for uploading chunks
+def metadata_flusher():
+    while True:
+        _metadata_dirty.wait()
+        time.sleep(METADATA_FLUSH_INTERVAL)
+        _metadata_dirty.clear()
+        flush_metadata()
+        if _metadata_cache["dirty"]:
+            _metadata_dirty.set()  # write failed, try again
+
+threading.Thread(target=metadata_flusher, daemon=True, name="metadata-flush").start()
+
+# Files anywhere under a directory plus the directories they sit in, from the directory index
+def list_directory(directory):
+    with _metadata_lock:
+        metadata = cached_metadata()
+        if directory.endswith('/'):
+            files = {path: metadata[path] for path in _dir_files.get(directory, ())}
+            return files, sorted(_dir_subdirs.get(directory, ()))
+        # Not a directory prefix the index knows about, fall back to a scan
+        files = {path: info for path, info in metadata.items() if path.startswith(directory)}
+    directories = set()
+    for path in files.keys():
+        parts = path.split('/')
+        if len(parts) > 2:
+            parent_dir = '/'.join(parts[:-1]) + '/'
+            if parent_dir.startswith(directory) and parent_dir != directory:
+                directories.add(parent_dir)
+    return files, sorted(directories)
+
+def subdirectories(directory):
+    if directory.endswith('/'):
+        with _metadata_lock:
+            cached_metadata()
+            return sorted(_dir_subdirs.get(directory, ()))
+    return list_directory(directory)[1]
+
+# Only the files directly in a directory, for the browse page
+def directory_children(directory):
+    parent = directory if directory.endswith('/') else directory + '/'
+    with _metadata_lock:
+        metadata = cached_metadata()
+        return {path: metadata[path] for path in _dir_children.get(parent, ())}
+
+# Chunk IDs derived from a per-file random nonce and the chunk index: one
+# os.urandom call per file instead of one uuid4 per chunk, and a retried chunk
+# upload reuses the same ID
+def new_file_nonce():
+    return os.urandom(8)
+
+def make_chunk_id(file_nonce, index):
+    return hashlib.blake2b(file_nonce + index.to_bytes(4, 'big'), digest_size=16).hexdigest()
+
+# Asynchronous function for uploading chunks; returns whether the node stored it
 def async_upload_chunk(node_url, chunk_data, chunk_id):
     try:
-        response = requests.post(
+        response = RETRY_SESSION.post(
             f"{node_url}/chunk",
             data=chunk_data,
             headers={"X-Chunk-ID": chunk_id}
         )
+        if not response.ok:
+            logging.error(f"Error uploading chunk {chunk_id} to {node_url}: HTTP {response.status_code}")
+        return response.ok
     except Exception as e:
         logging.error(f"Error uploading chunk {chunk_id} to {node_url}: {str(e)}")
-
-# Background reconciliation function
+        return False
+
+# Ask a node which of the given chunks it holds, in one request
+def chunks_exist(node_id, chunk_ids):
+    response = SESSION.post(f"{NODE_MAP[node_id]}/chunks/exists", json=list(chunk_ids))
+    response.raise_for_status()
+    return response.json()
+
+def delete_chunks(node_id, chunk_ids):
+    response = RETRY_SESSION.delete(f"{NODE_MAP[node_id]}/chunks", json=chunk_ids)
+    response.raise_for_status()
+    return response.json()
+
+# GET the chunk directly from the replicas in random order, spreading reads across
+# nodes; a 404 or error falls through to the next one, so no existence probe is
+# needed. Nodes that already failed during this download are tried last.
+def fetch_chunk(file_info, chunk_id, failed_nodes):
+    node_ids = [replica["node_id"] for replica in file_info["replicas"]]
+    random.shuffle(node_ids)
+    node_ids.sort(key=lambda node_id: node_id in failed_nodes)
+    for node_id in node_ids:
+        try:
+            response = SESSION.get(f"{NODE_MAP[node_id]}/chunk/{chunk_id}")
+        except Exception as e:
+            logging.error(f"Error fetching chunk {chunk_id} from {node_id}: {str(e)}")
+            failed_nodes.add(node_id)
+            continue
+        if response.status_code == 200:
+            return response.content
+        if response.status_code >= 500:
+            failed_nodes.add(node_id)
+    raise IOError(f"Failed to retrieve chunk {chunk_id}")
+
+# Upload one chunk to each replica node, then hand its buffer back to the pool
+def upload_replicas(buf, size, chunk_id, node_ids):
+    try:
+        chunk_data = memoryview(buf)[:size]
+        results = {node_id: async_upload_chunk(NODE_MAP[node_id], chunk_data, chunk_id) for node_id in node_ids}
+        chunk_data.release()
+        return results
+    finally:
+        put_buf(buf)
+
+# Copy a missing chunk back to node_id from another replica of the file;
+# returns whether the repair succeeded
+def repair_chunk(node_id, chunk_id, file_info):
+    try:
+        logging.info(f"Chunk {chunk_id} missing on {node_id}, initiating repair")
+        for replica in file_info["replicas"]:
+            backup_node_id = replica["node_id"]
+            if backup_node_id == node_id:
+                continue
+            backup_response = SESSION.get(f"{NODE_MAP[backup_node_id]}/chunk/{chunk_id}")
+            if backup_response.status_code == 200:
+                return async_upload_chunk(NODE_MAP[node_id], backup_response.content, chunk_id)
+    except Exception as e:
+        logging.error(f"Error during reconciliation: {str(e)}")
+    return False
+
+def reconcile_once():
+    # Saves replace the cached dict rather than mutating it, so it can be read without a copy
+    with _metadata_lock:
+        metadata = cached_metadata()
+    now = time.time()
+    for file_path in [path for path in _last_checked if path not in metadata]:
+        del _last_checked[file_path]
+    # Group chunks of files not checked recently by node, so each node gets a
+    # single existence check; files stop being added once RECONCILE_MAX_CHUNKS is reached
+    node_chunks = {}
+    checked_files = []
+    chunk_count = 0
+    for file_path, file_info in metadata.items():
+        if chunk_count >= RECONCILE_MAX_CHUNKS:
+            break
+        if _last_checked.get(file_path, 0) > now - RECONCILE_FRESHNESS:
+            continue
+        checked_files.append((file_path, file_info))
+        for replica in file_info["replicas"]:
+            for chunk_id in replica["chunk_ids"]:
+                node_chunks.setdefault(replica["node_id"], {})[chunk_id] = (file_path, file_info)
+                chunk_count += 1
+    # Check all nodes concurrently, then repair whatever is missing
+    checks = {RECONCILE_POOL.submit(chunks_exist, node_id, chunk_files): node_id
+              for node_id, chunk_files in node_chunks.items()}
+    repairs = {}
+    failed_nodes = set()
+    for future in as_completed(checks):
+        node_id = checks[future]
+        try:
+            exists = future.result()
+        except Exception as e:
+            logging.error(f"Error during reconciliation: {str(e)}")
+            failed_nodes.add(node_id)
+            continue
+        for chunk_id, (file_path, file_info) in node_chunks[node_id].items():
+            if not exists.get(chunk_id):
+                repairs[RECONCILE_POOL.submit(repair_chunk, node_id, chunk_id, file_info)] = file_path
+    failed_files = {repairs[future] for future in as_completed(repairs) if not future.result()}
+    # Files on a node that couldn't be checked, or with a failed repair, are retried next run
+    for file_path, file_info in checked_files:
+        if file_path in failed_files:
+            continue
+        if not any(replica["node_id"] in failed_nodes for replica in file_info["replicas"]):
+            _last_checked[file_path] = now
+
+# Background reconciliation, run on a fixed schedule
 def reconcile_chunks():
-    while True:
-        metadata = load_metadata()
-        for file_path, file_info in metadata.items():
-            for replica in file_info["replicas"]:
-                node_id = replica["node_id"]
-                chunk_ids = replica["chunk_ids"]
-                for chunk_id in chunk_ids:
-                    try:
-                        # Verify chunk exists
-                        response = requests.get(f"{NODE_MAP[node_id]}/chunk/{chunk_id}/exists")
-                        if response.status_code != 200 and bool(response.json().get("exists")):
-                            logging.info(f"Chunk {chunk_id} missing on {node_id}, initiating repair")
-                            # Repair logic (simplified example)
-                            backup_node_id = file_info["replicas"][1]["node_id"]
-                            backup_response = requests.get(f"{NODE_MAP[backup_node_id]}/chunk/{chunk_id}")
-                            if backup_response.status_code == 200:
-                                async_upload_chunk(NODE_MAP[node_id], backup_response.content, chunk_id)
-                    except Exception as e:
-                        logging.error(f"Error during reconciliation: {str(e)}")
-        time.sleep(60)  # Run reconciliation every 60 seconds
+    scheduler = sched.scheduler(time.monotonic, time.sleep)
+    def run():
+        started = time.monotonic()
+        try:
+            reconcile_once()
+        except Exception as e:
+            logging.error(f"Error during reconciliation: {str(e)}")
+        # Keep a steady interval; a run that overran waits a full interval
+        # instead of starting the next one back-to-back
+        delay = RECONCILE_INTERVAL - (time.monotonic() - started)
+        scheduler.enter(delay if delay > 0 else RECONCILE_INTERVAL, 1, run)
+    scheduler.enter(0, 1, run)
+    scheduler.run()
 
 # Web interface routes
 @app.route('/')
@@ -177,16 +613,9 @@ def index():
 @app.route('/browse')
 def browse():
     directory = request.args.get('dir', '/')
-    metadata = load_metadata()
-    files = {path: info for path, info in metadata.items() if path.startswith(directory)}
-    directories = set()
-    for path in files.keys():
-        parts = path.split('/')
-        if len(parts) > 2:
-            parent_dir = '/'.join(parts[:-1]) + '/'
-            if parent_dir.startswith(directory) and parent_dir != directory:
-                directories.add(parent_dir)
-    return render_template('browse.html', files=files, directories=sorted(directories), current_dir=directory)
+    files = directory_children(directory)
+    directories = subdirectories(directory)
+    return render_template('browse.html', files=files, directories=directories, current_dir=directory)
 
 @app.route('/register', methods=['GET', 'POST'])
 def register():
@@ -196,10 +625,7 @@ def register():
         if username in users:
             flash("Username already exists")
             return redirect(url_for('register'))
-        users[username] = {
-            "password": hashlib.sha256(password.encode()).hexdigest()
-        }
-        save_users(users)
+        users.add(username, hash_password(password))
         flash("Registration successful. Please log in.")
         return redirect(url_for('login'))
     return render_template('register.html')
@@ -209,8 +635,12 @@ def register():
 def login():
     if request.method == 'POST':
         username = request.form['username']
-        password = hashlib.sha256(request.form['password'].encode()).hexdigest()
-        if username in users and users[username]["password"] == password:
+        password = request.form['password']
+        user_record = users.get(username)
+        if user_record and verify_password(user_record, password):
+            if "hash" not in user_record:
+                # Upgrade the legacy unsalted hash now that we have the password
+                users.add(username, hash_password(password))
             user = User(username)
             login_user(user)
             flash("Logged in successfully.")
@@ -241,17 +671,37 @@ def upload_file():
             flash('No selected file')
             return redirect(request.url)
         if file:
-            file_data = file.read()
-            file_size = len(file_data)
             file_path = os.path.join(directory, file.filename)
+            file_size = 0
+            file_nonce = new_file_nonce()
             chunks = []
-            for i in range(0, file_size, CHUNK_SIZE):
-                chunk_data = file_data[i:i+CHUNK_SIZE]
-                chunk_id = str(uuid.uuid4())
+            futures = set()
+            done = []
+            # Read the upload a chunk at a time instead of loading it all into memory
+            while True:
+                buf = get_buf()
+                n = file.stream.readinto(buf)
+                if not n:
+                    put_buf(buf)
+                    break
+                file_size += n
+                chunk_id = make_chunk_id(file_nonce, len(chunks))
                 chunks.append(chunk_id)
                 # Asynchronous upload to nodes (2 replicas)
+                futures.add(UPLOAD_POOL.submit(upload_replicas, buf, n, chunk_id, ["node1", "node2"]))
+                # Stop reading ahead while too many chunks are waiting for the nodes
+                if len(futures) >= MAX_PENDING_UPLOADS:
+                    finished, futures = wait(futures, return_when=FIRST_COMPLETED)
+                    done.extend(finished)
+            # Wait for replication before recording the file
+            done.extend(wait(futures).done)
+            # Only record the file if every chunk reached at least one node
+            if not all(any(future.result().values()) for future in done):
+                # Best-effort cleanup of the chunks that did make it
                 for node_id in ["node1", "node2"]:
-                    threading.Thread(target=async_upload_chunk, args=(NODE_MAP[node_id], chunk_data, chunk_id)).start()
+                    DELETE_POOL.submit(delete_chunks, node_id, chunks)
+                flash("Error uploading file: some chunks could not be stored on any node")
+                return redirect(request.url)
             metadata = load_metadata()
             metadata[file_path] = {
                 "size": file_size,
@@ -276,39 +726,44 @@ def download_file(file_path):
         flash("File not found")
         return redirect(url_for('browse'))
     file_info = metadata[file_path]
-    replica = file_info["replicas"][0]
-    node_id = replica["node_id"]
-    chunk_ids = replica["chunk_ids"]
-    file_data = bytearray()
-    for chunk_id in chunk_ids:
+    chunk_ids = file_info["replicas"][0]["chunk_ids"]
+    # Fetch up to DOWNLOAD_AHEAD chunks in parallel and stream them out in file order,
+    # so only a window of the file is held in memory
+    pending = deque()
+    requests_left = iter(chunk_ids)
+    failed_nodes = set()
+    def fill():
+        for chunk_id in requests_left:
+            pending.append(DOWNLOAD_POOL.submit(fetch_chunk, file_info, chunk_id, failed_nodes))
+            if len(pending) >= DOWNLOAD_AHEAD:
+                break
+    fill()
+    # Wait for the first chunk here so errors can still be reported to the user
+    try:
+        if pending:
+            pending[0].result()
+    except Exception as e:
+        for future in pending:
+            future.cancel()
+        flash(f"Error downloading chunk: {str(e)}")
+        return redirect(url_for('browse'))
+    def generate():
         try:
-            response = requests.get(f"{NODE_MAP[node_id]}/chunk/{chunk_id}/exists")
-            if response.status_code == 200 and bool(response.json().get("exists")):
-                response = requests.get(f"{NODE_MAP[node_id]}/chunk/{chunk_id}")
-                file_data.extend(response.content)
-            else:
-                if len(file_info["replicas"]) > 1:
-                    backup_replica = file_info["replicas"][1]
-                    backup_node = backup_replica["node_id"]
-                    backup_response = requests.get(f"{NODE_MAP[backup_node]}/chunk/{chunk_id}/exists")
-                    if backup_response.status_code == 200 and bool(backup_response.json().get("exists")):
-                        backup_response = requests.get(f"{NODE_MAP[node_id]}/chunk/{chunk_id}")
-                        file_data.extend(backup_response.content)
-                    else:
-                        flash(f"Failed to retrieve chunk {chunk_id}")
-                        return redirect(url_for('browse'))
-                else:
-                    flash(f"Failed to retrieve chunk {chunk_id}")
-                    return redirect(url_for('browse'))
-        except Exception as e:
-            flash(f"Error downloading chunk: {str(e)}")
-            return redirect(url_for('browse'))
+            while pending:
+                yield pending.popleft().result()
+                fill()
+        finally:
+            # Client went away mid-download
+            for future in pending:
+                future.cancel()
     filename = os.path.basename(file_path)
-    return send_file(
-        io.BytesIO(file_data),
-        as_attachment=True,
-        download_name=filename,
-        mimetype='application/octet-stream'
+    return Response(
+        stream_with_context(generate()),
+        mimetype='application/octet-stream',
+        headers={
+            "Content-Disposition": f'attachment; filename="{filename}"',
+            "Content-Length": str(file_info["size"])
+        }
     )
 
 @app.route('/delete/<path:file_path>', methods=['POST'])
@@ -328,11 +783,19 @@ def delete_file_web(file_path):
                 "node_id": node_id,
                 "chunk_id": chunk_id
             })
+    # One batched delete per node, all nodes in parallel
+    node_chunks = {}
     for chunk_info in chunks_to_delete:
+        node_chunks.setdefault(chunk_info['node_id'], []).append(chunk_info['chunk_id'])
+    futures = [DELETE_POOL.submit(delete_chunks, node_id, chunk_ids) for node_id, chunk_ids in node_chunks.items()]
+    done, not_done = wait(futures, timeout=DELETE_TIMEOUT)
+    for future in done:
         try:
-            requests.delete(f"{NODE_MAP[chunk_info['node_id']]}/chunk/{chunk_info['chunk_id']}")
+            future.result()
         except Exception as e:
             flash(f"Error deleting chunk: {str(e)}")
+    if not_done:
+        flash("Some nodes are still deleting chunks")
     del metadata[file_path]
     save_metadata(metadata)
     flash(f"File {os.path.basename(file_path)} deleted successfully")
@@ -347,7 +810,8 @@ def create_file():
     file_size = file_data['size']
     metadata = load_metadata()
     chunk_count = (file_size + CHUNK_SIZE - 1) // CHUNK_SIZE
-    chunks = [str(uuid.uuid4()) for _ in range(chunk_count)]
+    file_nonce = new_file_nonce()
+    chunks = [make_chunk_id(file_nonce, i) for i in range(chunk_count)]
     available_nodes = ["node1", "node2", "node3"]
     replicas = []
     for i in range(2):
@@ -384,8 +848,7 @@ def get_file_metadata():
 @login_required
 def list_files():
     directory = request.args.get('directory', '/')
-    metadata = load_metadata()
-    files = {path: info for path, info in metadata.items() if path.startswith(directory)}
+    files, _ = list_directory(directory)
     return jsonify(files)
 
 @app.route('/api/file', methods=['DELETE'])
@@ -410,6 +873,19 @@ def delete_file():
         "chunks_to_delete": chunks_to_delete
     })
 
+def probe_node(node_url):
+    try:
+        response = HEALTH_SESSION.get(f"{node_url}/health", timeout=2)
+        if response.status_code == 200:
+            return response.json()
+        return {"status": "Unhealthy", "error": f"HTTP {response.status_code}"}
+    except requests.exceptions.ConnectionError:
+        return {"status": "Unreachable", "error": "Connection refused"}
+    except requests.exceptions.Timeout:
+        return {"status": "Unresponsive", "error": "Request timed out"}
+    except Exception as e:
+        return {"status": "Error", "error": str(e)}
+
 @app.route('/admin/dashboard')
 @login_required
 def admin_dashboard():
@@ -417,20 +893,9 @@ def admin_dashboard():
     #   flash("Admin privileges required.")
     #   return redirect(url_for('index'))
 
-    node_health = {}
-    for node_id, node_url in NODE_MAP.items():
-        try:
-            response = requests.get(f"{node_url}/health", timeout=2)
-            if response.status_code == 200:
-                node_health.update({node_id: response.json()})
-            else:
-                node_health.update({node_id: {"status": "Unhealthy", "error": f"HTTP {response.status_code}"}})
-        except requests.exceptions.ConnectionError:
-            node_health.update({node_id: {"status": "Unreachable", "error": "Connection refused"}})
-        except requests.exceptions.Timeout:
-            node_health.update({node_id: {"status": "Unresponsive", "error": "Request timed out"}})
-        except Exception as e:
-            node_health.update({node_id: {"status": "Error", "error": str(e)}})
+    # Probe all nodes at once, so the page waits for the slowest node rather than the sum
+    futures = {node_id: HEALTH_POOL.submit(probe_node, node_url) for node_id, node_url in NODE_MAP.items()}
+    node_health = {node_id: future.result() for node_id, future in futures.items()}
     print(node_health)
 
     return render_template('admin_dashboard.html', node_health=node_health, node_map=NODE_MAP)
@@ -66,13 +66,15 @@ templates = {
         <a href="/upload">Upload File</a>
     </div>
     
-    {% if get_flashed_messages() %}
+    {% with messages = get_flashed_messages() %}
+    {% if messages %}
     <div class="flash-message">
-        {% for message in get_flashed_messages() %}
+        {% for message in messages %}
             {{ message }}
         {% endfor %}
     </div>
     {% endif %}
+    {% endwith %}
     
     <div class="breadcrumb">
         <a href="/browse?dir=/">Root</a>
@@ -101,7 +103,6 @@ templates = {
         <h2>Files</h2>
         {% if files %}
             {% for path, info in files.items() %}
-                {% if path.startswith(current_dir) and path != current_dir and path.count('/') == current_dir.count('/') + 1 %}
                 <div class="file-item">
                     <div>
                         <strong>{{ path.split('/')[-1] }}</strong>
@@ -115,7 +116,6 @@ templates = {
                         </form>
                     </div>
                 </div>
-                {% endif %}
             {% endfor %}
         {% else %}
             <p>No files found in this directory.</p>